@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+from analysis.memo import memoize_derived
+from analysis.sketch_table import as_sketch_table
+
+
+@memoize_derived
+def get_actor_stats(data, attribute: str, min_appearances: int = 1) -> pd.DataFrame:
+    """Count, sum, mean, variance and median of an attribute over each actor's sketches, one row per actor.
+    Sketches missing the attribute are left out, and so are actors in fewer than min_appearances sketches that have it.
+    The variance is the population variance, like np.var"""
+    table = as_sketch_table(data)
+    values, valid = table.get_numeric_values(attribute)
+    incidence = table.actor_incidence
+    # centering on the overall mean keeps the squares small enough for the variance not to lose precision
+    center = values[valid].mean() if valid.any() else 0.0
+    centered = np.where(valid, values - center, 0.0)
+    count = incidence @ valid.astype(np.float64)
+    total = incidence @ np.where(valid, values, 0.0)
+    centered_sum = incidence @ centered
+    centered_square_sum = incidence @ (centered * centered)
+    keep = count >= max(min_appearances, 1)
+    count, total = count[keep], total[keep]
+    centered_sum, centered_square_sum = centered_sum[keep], centered_square_sum[keep]
+    centered_mean = centered_sum / count
+    _, sorted_values, offsets = _get_actor_values(table, values, valid, keep, sort=True)
+    lengths = np.diff(offsets)
+    lower, upper = offsets[:-1] + (lengths - 1) // 2, offsets[:-1] + lengths // 2
+    return pd.DataFrame(
+        {
+            "count": count.astype(np.int64),
+            "sum": total,
+            "mean": total / count,
+            "var": np.maximum(centered_square_sum / count - centered_mean**2, 0.0),
+            "median": (sorted_values[lower] + sorted_values[upper]) / 2,
+        },
+        index=pd.Index(np.asarray(table.actors, dtype=object)[keep], name="actor"),
+    )
+
+
+@memoize_derived
+def get_actor_values(data, attribute: str, min_appearances: int = 1) -> dict:
+    """The attribute values of each actor's sketches, in table order, for actors in at least min_appearances of them"""
+    table = as_sketch_table(data)
+    values, valid = table.get_numeric_values(attribute)
+    keep = table.actor_incidence @ valid.astype(np.float64) >= max(min_appearances, 1)
+    actors, actor_values, offsets = _get_actor_values(table, values, valid, keep)
+    return {actor: actor_values[start:end] for actor, start, end in zip(actors, offsets[:-1], offsets[1:])}
+
+
+def _get_actor_values(table, values: np.ndarray, valid: np.ndarray, keep: np.ndarray, sort: bool = False) -> tuple:
+    """The kept actors and their valid values back to back, with actor i's at actor_values[offsets[i]:offsets[i + 1]]"""
+    incidence = table.actor_incidence[keep][:, valid]
+    actor_values = values[valid][incidence.indices]
+    offsets = incidence.indptr
+    if sort:
+        actor_rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        actor_values = actor_values[np.lexsort((actor_values, actor_rows))]
+    return np.asarray(table.actors, dtype=object)[keep].tolist(), actor_values, offsets
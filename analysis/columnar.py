@@ -0,0 +1,190 @@
+import datetime
+import json
+import os
+import numpy as np
+from typing import Callable, Dict, Iterable, Iterator, List
+from schema import Sketch
+
+FULL_DATA_COLUMNS_PATH = "data/full_data_columns"
+SCENE_COLUMNS_PATH = "data/scene_columns"
+# rows are decoded this many at a time by iter_rows, which bounds how many decoded values exist at once
+ROW_CHUNK_SIZE = 4096
+
+# how every field is stored. Each column is one .npy file named after the field, plus:
+#   category: int32 codes (-1 for None) and the distinct values in <field>.categories
+#   category_list: codes of every list item back to back, <field>.offsets (row i is codes[offsets[i]:offsets[i + 1]]) and <field>.categories
+#   int: int64 values and a <field>.mask that is False where the value is None
+#   float: float64 values with NaN for None
+#   date, datetime: datetime64 values with NaT for None
+#   string: fixed width unicode
+SKETCH_COLUMN_KINDS = {
+    "id": "string",
+    "title": "string",
+    "scene_type": "category",
+    "cast": "category_list",
+    "episode_id": "category",
+    "air_date": "date",
+    "host": "category",
+    "upload_date": "datetime",
+    "duration": "int",
+    "view_count": "int",
+    "like_count": "int",
+    "comment_count": "int",
+    "mean_sentiment": "float",
+    "std_sentiment": "float",
+    "sentiment_comment_count": "int",
+    "sentiment_ci_width": "float",
+}
+
+SCENE_COLUMN_KINDS = {
+    # titles repeat for recurring sketches, and monologues have none
+    "title": "category",
+    "scene_type": "category",
+    "cast": "category_list",
+    "episode_id": "category",
+    "air_date": "date",
+    "host": "category",
+}
+
+
+def save_sketch_columns(sketches: List[Sketch], directory: str = FULL_DATA_COLUMNS_PATH):
+    """Writes the sketches as one typed NumPy column per field, which load much faster than json and can be memory mapped"""
+    save_columns(sketches, SKETCH_COLUMN_KINDS, directory, getattr)
+
+
+def save_scene_columns(scenes: Iterable[dict], directory: str = SCENE_COLUMNS_PATH):
+    """Writes scene dicts (or a stream of them) as columns. Missing fields are stored as None"""
+    save_columns(scenes, SCENE_COLUMN_KINDS, directory, lambda scene, field: scene.get(field))
+
+
+def save_columns(rows: Iterable, kinds: dict, directory: str, get_value: Callable):
+    """Writes a column per field of kinds. The rows are only iterated once and aren't kept, but every value is
+    collected into a Python list per field before being encoded, so the values of all rows are in memory at once"""
+    columns = encode_columns(rows, kinds, get_value)
+    os.makedirs(directory, exist_ok=True)
+    for name, column in columns.items():
+        np.save(os.path.join(directory, name + ".npy"), column, allow_pickle=False)
+    # written last, so a directory with a manifest always holds a complete set of columns
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+        manifest = {
+            "last_updated": datetime.datetime.now().isoformat(),
+            "num_rows": count_rows(columns, kinds),
+            "columns": sorted(columns),
+        }
+        json.dump(manifest, f, indent=4)
+
+
+def encode_columns(rows: Iterable, kinds: dict, get_value: Callable) -> Dict[str, np.ndarray]:
+    """Encodes rows into a column per field of kinds, in memory"""
+    values = {field: [] for field in kinds}
+    for row in rows:
+        for field, field_values in values.items():
+            field_values.append(get_value(row, field))
+    columns = {}
+    for field, kind in kinds.items():
+        columns.update(_encode_column(field, kind, values[field]))
+    return columns
+
+
+def count_rows(columns: Dict[str, np.ndarray], kinds: dict) -> int:
+    field, kind = next(iter(kinds.items()))
+    if kind == "category_list":
+        return len(columns[field + ".offsets"]) - 1
+    return len(columns[field])
+
+
+def load_columns(directory: str, mmap: bool = False) -> Dict[str, np.ndarray]:
+    """Returns every stored column by name (see the column kinds above for the layout).
+    With mmap, columns are memory mapped read only instead of read into memory"""
+    with open(os.path.join(directory, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return {
+        name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r" if mmap else None, allow_pickle=False)
+        for name in manifest["columns"]
+    }
+
+
+def is_stale(directory: str, source_path: str) -> bool:
+    """Whether the columns in directory are missing or older than the file they were built from"""
+    manifest_path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return True
+    return os.path.exists(source_path) and os.path.getmtime(source_path) > os.path.getmtime(manifest_path)
+
+
+def columns_to_sketches(columns: Dict[str, np.ndarray]) -> List[Sketch]:
+    """Rebuilds the Sketch models from loaded columns"""
+    # the columns were written from validated sketches, so validating them again is wasted work
+    return [Sketch.model_construct(**row) for row in get_rows(columns, SKETCH_COLUMN_KINDS)]
+
+
+def get_rows(columns: Dict[str, np.ndarray], kinds: dict, rows: np.ndarray = None, fields: list = None) -> List[dict]:
+    """Decodes the given rows (all by default) into a list of dicts, with only the given fields if any"""
+    return list(iter_rows(columns, kinds, rows, fields))
+
+
+def iter_rows(
+    columns: Dict[str, np.ndarray], kinds: dict, rows: np.ndarray = None, fields: list = None, chunk_size: int = ROW_CHUNK_SIZE
+) -> Iterator[dict]:
+    """Yields the given rows (all by default) as dicts one at a time, with only the given fields if any.
+    Rows are decoded a chunk at a time, so neither every dict nor every decoded value is held at once"""
+    fields = list(kinds) if fields is None else fields
+    rows = np.arange(count_rows(columns, kinds)) if rows is None else np.asarray(rows)
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        values = [decode_column(columns, field, kinds[field], chunk) for field in fields]
+        for row in zip(*values):
+            yield dict(zip(fields, row))
+
+
+def decode_column(columns: Dict[str, np.ndarray], field: str, kind: str, rows: np.ndarray = None) -> list:
+    """Turns a column (or just the given rows of it) back into the Python values the field holds"""
+    column = columns[field]
+    if kind == "category_list":
+        offsets = columns[field + ".offsets"]
+        starts, ends = (offsets[:-1], offsets[1:]) if rows is None else (offsets[rows], offsets[np.asarray(rows) + 1])
+        categories = np.asarray(columns[field + ".categories"], dtype=object)
+        return [categories[column[start:end]].tolist() for start, end in zip(starts.tolist(), ends.tolist())]
+    if rows is not None:
+        column = column[rows]
+    if kind == "string":
+        return column.tolist()
+    if kind == "category":
+        categories = columns[field + ".categories"].tolist()
+        return [None if code < 0 else categories[code] for code in column.tolist()]
+    if kind == "int":
+        mask = columns[field + ".mask"] if rows is None else columns[field + ".mask"][rows]
+        return [value if valid else None for value, valid in zip(column.tolist(), mask.tolist())]
+    if kind == "float":
+        return [None if np.isnan(value) else value for value in column.tolist()]
+    if kind in ("date", "datetime"):
+        strings = np.datetime_as_string(column).tolist()
+        suffix = "Z" if kind == "datetime" else ""
+        return [None if value == "NaT" else value + suffix for value in strings]
+    raise ValueError(f"unknown column kind {kind}")
+
+
+def _encode_column(field: str, kind: str, values: list) -> Dict[str, np.ndarray]:
+    if kind == "string":
+        return {field: np.array(values, dtype=str)}
+    if kind == "category":
+        categories = sorted({value for value in values if value is not None})
+        codes_by_value = {value: code for code, value in enumerate(categories)}
+        codes = np.array([codes_by_value.get(value, -1) for value in values], dtype=np.int32)
+        return {field: codes, field + ".categories": np.array(categories, dtype=str)}
+    if kind == "category_list":
+        categories = sorted({item for items in values for item in items})
+        codes_by_value = {value: code for code, value in enumerate(categories)}
+        codes = np.array([codes_by_value[item] for items in values for item in items], dtype=np.int32)
+        offsets = np.concatenate([[0], np.cumsum([len(items) for items in values])]).astype(np.int64)
+        return {field: codes, field + ".offsets": offsets, field + ".categories": np.array(categories, dtype=str)}
+    if kind == "int":
+        mask = np.array([value is not None for value in values], dtype=bool)
+        return {field: np.array([0 if value is None else value for value in values], dtype=np.int64), field + ".mask": mask}
+    if kind == "float":
+        return {field: np.array([np.nan if value is None else value for value in values], dtype=np.float64)}
+    if kind in ("date", "datetime"):
+        unit = "D" if kind == "date" else "s"
+        # numpy parses iso strings but not the trailing Z of youtube timestamps
+        return {field: np.array([None if value is None else value.rstrip("Z") for value in values], dtype=f"datetime64[{unit}]")}
+    raise ValueError(f"unknown column kind {kind}")
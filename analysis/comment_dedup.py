@@ -0,0 +1,147 @@
+import re
+import numpy as np
+
+# 8 bands of 8 rows put the near duplicate cutoff at a jaccard similarity of about (1 / 8) ** (1 / 8) = 0.77
+LSH_BANDS = 8
+LSH_ROWS = 8
+SHINGLE_SIZE = 4
+# texts this short (like "lol" or a few emojis) are shingled by pairs of characters instead
+SHORT_TEXT_CHARS = 2 * SHINGLE_SIZE
+SHORT_SHINGLE_SIZE = 2
+# long comments are only compared by their start, which keeps a page's shingle matrix small
+MAX_SHINGLED_CHARS = 500
+
+# "soooo good!!!" and "so good!" are shingled the same
+_REPEATED_CHARACTERS = re.compile(r"(.)\1+")
+
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+_random = np.random.RandomState(0)
+# odd multipliers for multiply-shift hashing, one per minhash permutation
+_MULTIPLIERS = _random.randint(0, 2**63, size=LSH_BANDS * LSH_ROWS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_INCREMENTS = _random.randint(0, 2**63, size=LSH_BANDS * LSH_ROWS, dtype=np.uint64)
+
+
+def normalize_comment(text: str) -> str:
+    """Comments that only differ by case or whitespace are exact duplicates"""
+    return " ".join(str(text).lower().split())
+
+
+def get_minhash_signatures(texts: list) -> np.ndarray:
+    """MinHash signatures of the character shingles of each text, one row of LSH_BANDS * LSH_ROWS values per text.
+    Runs of a repeated character count as one, and texts shorter than SHORT_TEXT_CHARS are shingled by
+    SHORT_SHINGLE_SIZE characters, since a couple of long shingles can't tell how close two short texts are"""
+    signatures = np.empty((len(texts), LSH_BANDS * LSH_ROWS), dtype=np.uint64)
+    shingled = [_REPEATED_CHARACTERS.sub(r"\1", normalize_comment(text))[:MAX_SHINGLED_CHARS] for text in texts]
+    is_short = np.array([len(text) < SHORT_TEXT_CHARS for text in shingled], dtype=bool)
+    for shingle_size, rows in ((SHINGLE_SIZE, np.flatnonzero(~is_short)), (SHORT_SHINGLE_SIZE, np.flatnonzero(is_short))):
+        if len(rows) > 0:
+            signatures[rows] = _get_signatures([shingled[row] for row in rows.tolist()], shingle_size)
+    return signatures
+
+
+def _get_signatures(texts: list, shingle_size: int) -> np.ndarray:
+    # texts shorter than a shingle are padded so that every text has at least one
+    texts = [text.ljust(shingle_size) for text in texts]
+    lengths = np.array([len(text) for text in texts], dtype=np.int64)
+    codepoints = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    codepoints = np.concatenate([codepoints, np.zeros(shingle_size, dtype=np.uint64)])
+
+    # FNV-1a over the characters of the shingle starting at every position
+    shingles = np.full(len(codepoints) - shingle_size, _FNV_OFFSET)
+    for offset in range(shingle_size):
+        shingles = (shingles ^ codepoints[offset:offset + len(shingles)]) * _FNV_PRIME
+    # drop the shingles that run into the next text
+    text_starts = np.cumsum(lengths) - lengths
+    position = np.arange(len(shingles)) - np.repeat(text_starts, lengths)
+    shingles = shingles[position <= np.repeat(lengths, lengths) - shingle_size]
+
+    permuted = (_MULTIPLIERS[:, None] * shingles[None, :] + _INCREMENTS[:, None]) >> np.uint64(32)
+    shingle_starts = np.cumsum(lengths - shingle_size + 1) - (lengths - shingle_size + 1)
+    return np.minimum.reduceat(permuted, shingle_starts, axis=1).T
+
+
+def get_band_keys(texts: list) -> np.ndarray:
+    """Locality sensitive hashes of each text's MinHash signature, one per band.
+    Two texts sharing any band key are likely near duplicates"""
+    signatures = get_minhash_signatures(texts).reshape(len(texts), LSH_BANDS, LSH_ROWS)
+    keys = np.full((len(texts), LSH_BANDS), _FNV_OFFSET)
+    for row in range(LSH_ROWS):
+        keys = (keys ^ signatures[:, :, row]) * _FNV_PRIME
+    return keys
+
+
+class CommentDeduplicator:
+    """Keeps track of one video's comments as its pages come in. Exact duplicates (same text up to case and
+    whitespace) are only scored once and share that score. Near duplicates are never given each other's score,
+    since a changed word can flip the sentiment, but they are grouped into clusters of copies of the same comment.
+
+    With max_copies set, copies of a comment past the first max_copies of its cluster are treated as spam
+    (pasted jokes, bots) and don't count toward the video's stats"""
+
+    def __init__(self, max_copies: int = None):
+        self.max_copies = max_copies
+        # the first comment with each distinct text, its score (None until scored) and its cluster
+        self.texts = []
+        self.scores = []
+        self.text_clusters = []
+        # the number of comments in each cluster of near duplicates
+        self.sizes = []
+        self.num_comments = 0
+        self._ids_by_text = {}
+        self._clusters_by_band = [{} for _ in range(LSH_BANDS)]
+
+    def assign(self, texts: list, band_keys: np.ndarray) -> tuple:
+        """Adds a page of comments. Returns the id of each comment's distinct text,
+        which its score is shared by, and whether the comment counts toward the stats"""
+        text_ids = np.empty(len(texts), dtype=np.int64)
+        counted = np.ones(len(texts), dtype=bool)
+        for i, text in enumerate(texts):
+            normalized = normalize_comment(text)
+            text_id = self._ids_by_text.get(normalized)
+            if text_id is None:
+                keys = band_keys[i].tolist()
+                cluster = next(
+                    (bucket[key] for bucket, key in zip(self._clusters_by_band, keys) if key in bucket), None
+                )
+                if cluster is None:
+                    cluster = len(self.sizes)
+                    self.sizes.append(0)
+                for bucket, key in zip(self._clusters_by_band, keys):
+                    bucket.setdefault(key, cluster)
+                text_id = self._add_text(normalized, text, cluster)
+            cluster = self.text_clusters[text_id]
+            self.sizes[cluster] += 1
+            text_ids[i] = text_id
+            counted[i] = self.max_copies is None or self.sizes[cluster] <= self.max_copies
+        self.num_comments += len(texts)
+        return text_ids, counted
+
+    def get_unscored(self, text_ids: np.ndarray) -> np.ndarray:
+        return np.array([text_id for text_id in np.unique(text_ids) if self.scores[text_id] is None], dtype=np.int64)
+
+    def set_scores(self, text_ids: np.ndarray, scores: np.ndarray):
+        for text_id, score in zip(text_ids, scores):
+            # another page may have scored the same text in the meantime
+            if self.scores[text_id] is None:
+                self.scores[text_id] = float(score)
+
+    def get_scores(self, text_ids: np.ndarray) -> np.ndarray:
+        return np.array([self.scores[text_id] for text_id in text_ids], dtype=float)
+
+    @property
+    def num_duplicates(self) -> int:
+        """Comments whose score was shared from an exact duplicate"""
+        return self.num_comments - len(self.texts)
+
+    @property
+    def num_near_duplicates(self) -> int:
+        """Comments that are a copy, exact or near, of an earlier comment"""
+        return self.num_comments - len(self.sizes)
+
+    def _add_text(self, normalized: str, text: str, cluster: int) -> int:
+        self._ids_by_text[normalized] = len(self.texts)
+        self.texts.append(text)
+        self.scores.append(None)
+        self.text_clusters.append(cluster)
+        return len(self.texts) - 1
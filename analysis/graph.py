@@ -1,15 +1,15 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from analysis.load_data import load_full_data
+from analysis.load_data import load_sketch_table
+from analysis.actor_stats import get_actor_stats
+from analysis.group_by import GroupBy
+from analysis.sketch_table import as_sketch_table
 import pandas as pd
 import matplotlib.dates as mdates
 
-all_scene_types = None
-all_actors = None
-
 def draw_all_graphs_and_tables(attribute):
     # Load data
-    data = load_full_data()
+    data = load_sketch_table()
     draw_boxplot_for_scene_type(data, attribute)
     table_of_mean_and_std_by_scene_type(data, attribute)
     bar_chart_of_mean_and_std_by_scene_type(data, attribute)
@@ -23,15 +23,10 @@ def draw_boxplot_for_scene_type(data, attribute):
     # check is attribute is numeric
     if not np.issubdtype(type(getattr(data[0], attribute)), np.number):
         raise TypeError("Attribute " + attribute + " is not numeric")
-    # find all scene types
-    scene_types = get_scene_types(data)
     # box plot of views for different scene types
-    boxplot_data = [
-        [getattr(sketch, attribute) for sketch in data if sketch.scene_type == scene_type and getattr(sketch, attribute) is not None] for scene_type in scene_types
-    ]
-    boxplot_data = list(boxplot_data)
+    values_by_scene_type = get_values_by_scene_type(data, attribute)
     fig, ax = plt.subplots(figsize=(12, 5)) # set size so y labels aren't cut off
-    ax.boxplot(boxplot_data, vert=False, labels=scene_types)
+    ax.boxplot(list(values_by_scene_type.values()), vert=False, labels=list(values_by_scene_type))
     ax.set_title('Boxplot of ' + attribute + ' by Scene Types')
     ax.set_xlabel(attribute)
     ax.set_ylabel('Scene Types')
@@ -129,39 +124,25 @@ def time_series_of_attribute_over_time(data, attribute):
     plt.show()
 
 
-def get_scene_types(data):
-    global all_scene_types
-    if all_scene_types is None:
-        all_scene_types = set(sketch.scene_type for sketch in data if sketch.scene_type is not None)
-    return all_scene_types
+def get_scene_type_groups(data, attribute):
+    table = as_sketch_table(data)
+    values, mask = table.get_numeric_values(attribute)
+    return GroupBy.from_field(table, "scene_type"), values, mask
 
-def get_actors(data):
-    global all_actors
-    if all_actors is None:
-        all_actors = set()
-        for sketch in data:
-            for actor in sketch.cast:
-                if actor is not None:
-                    all_actors.add(actor)
-    return all_actors
+def get_values_by_scene_type(data, attribute):
+    scene_type_groups, values, mask = get_scene_type_groups(data, attribute)
+    return scene_type_groups.get_group_values(values, mask)
 
 def get_mean_and_std_by_scene_type(data, attribute):
-    means = []
-    sds = []
-    scene_types = get_scene_types(data)
-    for scene_type in scene_types:
-        values = [getattr(sketch, attribute) for sketch in data if sketch.scene_type == scene_type and getattr(sketch, attribute) is not None]
-        means.append(np.mean(values))
-        sds.append(np.std(values))
-    return scene_types, means, sds
+    scene_type_groups, values, mask = get_scene_type_groups(data, attribute)
+    scene_type_stats = scene_type_groups.aggregate(values, mask, quantiles=())
+    # only the scene types that are in the data
+    scene_type_stats = scene_type_stats[scene_type_groups.get_counts() > 0]
+    return scene_type_stats.index.tolist(), scene_type_stats["mean"].tolist(), scene_type_stats["std"].tolist()
 
-def get_sorted_actors_and_means(data, attribute):
-    actors = get_actors(data)
-    means = []
-    for actor in actors:
-        values = [getattr(sketch, attribute) for sketch in data if actor in sketch.cast and getattr(sketch, attribute) is not None]
-        means.append(np.mean(values))
-    return zip(*sorted(zip(actors, means), key=lambda x: x[1], reverse=True))
+def get_sorted_actors_and_means(data, attribute, min_appearances=1):
+    actor_stats = get_actor_stats(data, attribute, min_appearances).sort_values("mean", ascending=False, kind="stable")
+    return actor_stats.index.tolist(), actor_stats["mean"].tolist()
 
 if __name__ == '__main__':
     draw_all_graphs_and_tables("view_count")
\ No newline at end of file
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+from analysis.columnar import SKETCH_COLUMN_KINDS
+from analysis.sketch_table import as_sketch_table
+
+
+class GroupBy:
+    """Rows split into groups by a key that is encoded once, as one group code per row (-1 for rows in no group).
+    Every statistic is computed for all groups at once, with np.bincount or a single sort of the rows by group"""
+
+    def __init__(self, codes: np.ndarray, labels: list):
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.labels = list(labels)
+
+    @classmethod
+    def from_field(cls, data, field: str) -> "GroupBy":
+        """Groups sketches by the value of a field. Categorical fields use their stored codes as is,
+        any other field is grouped by its distinct values. Rows where the field is None are in no group"""
+        table = as_sketch_table(data)
+        if SKETCH_COLUMN_KINDS[field] == "category":
+            return cls(table.columns[field], table.columns[field + ".categories"].tolist())
+        values, mask = np.asarray(table.get_values(field)), table.get_mask(field)
+        labels, inverse = np.unique(values[mask], return_inverse=True)
+        codes = np.full(len(values), -1, dtype=np.int64)
+        codes[mask] = inverse
+        return cls(codes, labels.tolist())
+
+    @property
+    def num_groups(self) -> int:
+        return len(self.labels)
+
+    def get_counts(self, mask: np.ndarray = None) -> np.ndarray:
+        """Number of rows (or of rows where mask is True) in each group"""
+        return np.bincount(self.codes[self._get_rows(mask)], minlength=self.num_groups)
+
+    def aggregate(self, values: np.ndarray, mask: np.ndarray = None, quantiles: tuple = (0.25, 0.5, 0.75), ddof: int = 0) -> pd.DataFrame:
+        """Count, mean, standard deviation (np.std's with the default ddof) and quantiles of values for each group,
+        leaving out rows where mask is False. Quantiles interpolate linearly, like np.quantile.
+        Groups without any values have a count of 0 and NaN for everything else"""
+        rows = self._get_rows(mask)
+        codes, values = self.codes[rows], np.asarray(values, dtype=np.float64)[rows]
+        count = np.bincount(codes, minlength=self.num_groups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(codes, weights=values, minlength=self.num_groups) / count
+            # deviations from each group's own mean, so large values don't cancel out
+            deviations = values - mean[codes]
+            variance = np.bincount(codes, weights=deviations * deviations, minlength=self.num_groups) / (count - ddof)
+        result = {"count": count, "mean": mean, "std": np.sqrt(np.where(count > ddof, variance, np.nan))}
+        if quantiles:
+            sorted_values, offsets = self._segment(codes, values, sort=True)
+            for q in quantiles:
+                result[f"{q * 100:g}%"] = _get_segment_quantiles(sorted_values, offsets, q)
+        return pd.DataFrame(result, index=pd.Index(self.labels, name="group"))
+
+    def get_group_values(self, values: np.ndarray, mask: np.ndarray = None, min_count: int = 1) -> dict:
+        """The values of each group with at least min_count of them, in row order, leaving out rows where mask is False"""
+        rows = self._get_rows(mask)
+        group_values, offsets = self._segment(self.codes[rows], np.asarray(values)[rows])
+        return {
+            label: group_values[start:end]
+            for label, start, end in zip(self.labels, offsets[:-1].tolist(), offsets[1:].tolist())
+            if end - start >= max(min_count, 1)
+        }
+
+    def _get_rows(self, mask: np.ndarray) -> np.ndarray:
+        rows = self.codes >= 0
+        return rows if mask is None else rows & mask
+
+    def _segment(self, codes: np.ndarray, values: np.ndarray, sort: bool = False) -> tuple:
+        """values ordered by group (and by value within a group if sort), with group i's at values[offsets[i]:offsets[i + 1]]"""
+        order = np.lexsort((values, codes)) if sort else np.argsort(codes, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=self.num_groups))])
+        return values[order], offsets
+
+
+def _get_segment_quantiles(sorted_values: np.ndarray, offsets: np.ndarray, q: float) -> np.ndarray:
+    lengths = np.diff(offsets)
+    quantiles = np.full(len(lengths), np.nan)
+    present = lengths > 0
+    position = offsets[:-1][present] + q * (lengths[present] - 1)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    fraction = position - lower
+    quantiles[present] = sorted_values[lower] * (1 - fraction) + sorted_values[upper] * fraction
+    return quantiles
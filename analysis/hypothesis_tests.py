@@ -0,0 +1,150 @@
+import datetime
+import json
+import multiprocessing
+import numpy as np
+import scipy.stats as stats
+from analysis.group_by import GroupBy
+from analysis.load_data import load_sketch_table
+from analysis.sketch_table import SketchTable, as_sketch_table
+
+HYPOTHESIS_TESTS_PATH = "data/hypothesis_tests.json"
+ATTRIBUTES = ["view_count", "like_count", "comment_count", "mean_sentiment", "std_sentiment"]
+GROUPINGS = ["scene_type", "actor", "duration", "upload_year"]
+NUM_DURATION_BINS = 4
+# like test.py, groups with 2 or fewer values are left out
+MIN_GROUP_SIZE = 3
+
+_worker_designs = None
+_worker_values = None
+
+
+def run_hypothesis_tests(
+    data=None,
+    attributes: list = ATTRIBUTES,
+    groupings: list = GROUPINGS,
+    num_processes: int = None,
+    path: str = HYPOTHESIS_TESTS_PATH,
+) -> list:
+    """Runs a one-way ANOVA and a Kruskal-Wallis test of every attribute by every grouping and writes them all to path.
+    Each grouping is encoded once and shared by every attribute, and the combinations are spread over num_processes
+    processes (every core by default, 1 runs them here)"""
+    table = load_sketch_table() if data is None else as_sketch_table(data)
+    designs = {grouping: get_design(table, grouping) for grouping in groupings}
+    values = {attribute: table.get_numeric_values(attribute) for attribute in attributes}
+    combinations = [(attribute, grouping) for attribute in attributes for grouping in groupings]
+    num_processes = multiprocessing.cpu_count() if num_processes is None else num_processes
+    if num_processes > 1:
+        # workers receive the designs and values once on startup, so tasks only carry the names
+        with multiprocessing.Pool(
+            processes=min(num_processes, len(combinations)),
+            initializer=_init_test_worker,
+            initargs=(designs, values),
+        ) as pool:
+            results = pool.map(_run_combination, combinations)
+    else:
+        _init_test_worker(designs, values)
+        results = [_run_combination(combination) for combination in combinations]
+    with open(path, "w", encoding="utf-8") as f:
+        data = {
+            "last_updated": datetime.datetime.now().isoformat(),
+            "hypothesis_tests": results,
+        }
+        json.dump(data, f, indent=4)
+    return results
+
+
+def get_design(table: SketchTable, grouping: str) -> tuple:
+    """The groups of a grouping and the table row of each of their rows (None when they are the table's rows).
+    Actor groups have a row per actor in a sketch's cast, so a sketch counts toward every actor in it"""
+    if grouping == "scene_type":
+        return GroupBy.from_field(table, "scene_type"), None
+    if grouping == "actor":
+        incidence = table.actor_incidence
+        codes = np.repeat(np.arange(incidence.shape[0]), np.diff(incidence.indptr))
+        return GroupBy(codes, table.actors), incidence.indices
+    if grouping == "duration":
+        durations, mask = table.get_numeric_values("duration")
+        if not mask.any():
+            return GroupBy(np.full(len(table), -1), []), None
+        # equal width bins from the shortest to the longest sketch
+        edges = np.linspace(durations[mask].min(), durations[mask].max(), NUM_DURATION_BINS + 1)
+        codes = np.clip(np.searchsorted(edges, durations, side="right") - 1, 0, NUM_DURATION_BINS - 1)
+        labels = [f"{low:g}-{high:g}" for low, high in zip(edges[:-1], edges[1:])]
+        return GroupBy(np.where(mask, codes, -1), labels), None
+    if grouping == "upload_year":
+        upload_dates = np.asarray(table.get_values("upload_date"))
+        years = upload_dates.astype("datetime64[Y]").astype(np.int64) + 1970
+        mask = table.get_mask("upload_date")
+        labels = np.unique(years[mask])
+        return GroupBy(np.where(mask, np.searchsorted(labels, years), -1), labels.tolist()), None
+    raise ValueError(f"unknown grouping {grouping}, expected one of {GROUPINGS}")
+
+
+def test_groups(groups: GroupBy, values: np.ndarray, mask: np.ndarray, min_group_size: int = MIN_GROUP_SIZE) -> dict:
+    """One-way ANOVA and Kruskal-Wallis test of the groups with at least min_group_size values,
+    from each group's count, mean and variance and its sum of ranks"""
+    counts = groups.get_counts(mask)
+    kept = counts >= min_group_size
+    included = mask & (groups.codes >= 0) & kept[np.maximum(groups.codes, 0)]
+    group_stats = groups.aggregate(values, included, quantiles=(), ddof=1)[kept]
+    sizes = group_stats["count"].to_numpy(dtype=np.float64)
+    means = group_stats["mean"].to_numpy()
+    num_groups, num_values = len(sizes), int(sizes.sum())
+    result = {
+        "num_groups": num_groups,
+        "num_values": num_values,
+        "groups": [
+            {"group": label, "count": int(count), "mean": float(mean), "std": float(std)}
+            for label, count, mean, std in zip(group_stats.index, sizes, means, group_stats["std"])
+        ],
+        "anova": None,
+        "kruskal_wallis": None,
+    }
+    if num_groups < 2:
+        return result
+
+    between_df, within_df = num_groups - 1, num_values - num_groups
+    grand_mean = np.sum(sizes * means) / num_values
+    between_sum_of_squares = np.sum(sizes * (means - grand_mean) ** 2)
+    within_sum_of_squares = np.sum((sizes - 1) * group_stats["std"].to_numpy() ** 2)
+    f_statistic = (between_sum_of_squares / between_df) / (within_sum_of_squares / within_df)
+    result["anova"] = {
+        "statistic": float(f_statistic),
+        "df_between": between_df,
+        "df_within": within_df,
+        "mse": float(within_sum_of_squares / within_df),
+        "p_value": float(stats.f.sf(f_statistic, between_df, within_df)),
+    }
+
+    included_values = values[included]
+    ranks = stats.rankdata(included_values)
+    rank_sums = np.bincount(groups.codes[included], weights=ranks, minlength=groups.num_groups)[kept]
+    h_statistic = 12 / (num_values * (num_values + 1)) * np.sum(rank_sums**2 / sizes) - 3 * (num_values + 1)
+    _, tie_counts = np.unique(included_values, return_counts=True)
+    tie_correction = 1 - np.sum(tie_counts**3 - tie_counts) / (num_values**3 - num_values)
+    h_statistic = h_statistic / tie_correction if tie_correction > 0 else np.nan
+    result["kruskal_wallis"] = {
+        "statistic": float(h_statistic),
+        "df": between_df,
+        "p_value": float(stats.chi2.sf(h_statistic, between_df)),
+    }
+    return result
+
+
+def _init_test_worker(designs: dict, values: dict):
+    global _worker_designs, _worker_values
+    _worker_designs = designs
+    _worker_values = values
+
+
+def _run_combination(combination: tuple) -> dict:
+    attribute, grouping = combination
+    groups, rows = _worker_designs[grouping]
+    values, mask = _worker_values[attribute]
+    if rows is not None:
+        values, mask = values[rows], mask[rows]
+    return {"attribute": attribute, "grouping": grouping, **test_groups(groups, values, mask)}
+
+
+if __name__ == "__main__":
+    run_hypothesis_tests()
@@ -1,33 +1,100 @@
 import json
+import re
+import numpy as np
+from typing import Iterator
 from schema import Sketch
+from analysis.columnar import (
+    FULL_DATA_COLUMNS_PATH,
+    SCENE_COLUMNS_PATH,
+    SCENE_COLUMN_KINDS,
+    columns_to_sketches,
+    iter_rows,
+    is_stale,
+    load_columns,
+    save_scene_columns,
+    save_sketch_columns,
+)
+from analysis.memo import memoize_files
+from analysis.sketch_table import SketchTable
 import datetime
 
-_cached_scenes = None
-_cached_videos = None
-_cached_full_data = None
-
 
+# the columns are rebuilt from the json whenever it is newer, so only the json decides whether a cached load is current
+@memoize_files("data/scenes.json")
 def load_scene_data():
-    global _cached_scenes
+    return list(iter_scene_data())
 
-    if _cached_scenes is not None:
-        return _cached_scenes
-    
-    with open("data/scenes.json", "r", encoding="utf-8") as f:
-        _cached_scenes = json.load(f)
-    _cached_scenes = _cached_scenes["scene_data"]
-    return _cached_scenes
 
+def iter_scene_data(fields: list = None) -> Iterator[dict]:
+    """Yields the scenes one at a time from their compact columns, with only the given fields if any.
+    The columns are memory mapped and decoded a chunk of rows at a time, so only the scenes kept by the caller stay in memory"""
+    yield from iter_rows(load_scene_columns(mmap=True), SCENE_COLUMN_KINDS, fields=fields)
 
-def load_video_data():
-    global _cached_videos
 
-    if _cached_videos is not None:
-        return _cached_videos
-    
+def load_scene_columns(mmap: bool = False) -> dict:
+    """Returns the scenes as typed columns (see analysis/columnar.py), memory mapped if mmap.
+    The columns are rebuilt by streaming scenes.json when they are missing or older than it"""
+    if is_stale(SCENE_COLUMNS_PATH, "data/scenes.json"):
+        save_scene_columns(stream_scene_json())
+    return load_columns(SCENE_COLUMNS_PATH, mmap=mmap)
+
+
+def stream_scene_json(path: str = "data/scenes.json", fields: list = None) -> Iterator[dict]:
+    """Yields the scenes in scenes.json one at a time without reading the whole file, with only the given fields if any"""
+    with open(path, "r", encoding="utf-8") as f:
+        for scene in _stream_json_array(f, "scene_data"):
+            yield scene if fields is None else {field: scene.get(field) for field in fields}
+
+
+_WHITESPACE_AND_COMMAS = re.compile(r"[\s,]*")
+
+
+def _stream_json_array(f, key: str, chunk_size: int = 64 * 1024) -> Iterator:
+    """Decodes the items of the array stored under a top level key of the json object in f, one item at a time"""
+    decoder = json.JSONDecoder()
+    array_start = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+    buffer = ""
+    while (match := array_start.search(buffer)) is None:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            raise KeyError(f"no array under {key!r}")
+        buffer += chunk
+    position = match.end()
+    end_of_file = False
+    while True:
+        position = _WHITESPACE_AND_COMMAS.match(buffer, position).end()
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            if position == len(buffer):
+                raise json.JSONDecodeError("ran out of buffered input", buffer, position)
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # the item runs past the end of the buffer, so read on
+            if end_of_file:
+                raise
+            chunk = f.read(chunk_size)
+            end_of_file = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+
+
+def load_episode_data() -> dict:
+    """Returns the stored episodes keyed by url, or an empty dict if the archive hasn't been scraped per episode yet"""
+    try:
+        with open("data/episodes.json", "r", encoding="utf-8") as f:
+            episodes = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return episodes["episodes"]
+
+
+@memoize_files("data/channel_videos.json")
+def load_video_data():
     with open("data/channel_videos.json", "r", encoding="utf-8") as f:
-        _cached_videos = json.load(f)
-    return _cached_videos["channel_videos"]
+        return json.load(f)["channel_videos"]
 
 
 def is_not_recent(date: str, days: int) -> bool:
@@ -35,14 +102,35 @@ def is_not_recent(date: str, days: int) -> bool:
     now = datetime.datetime.now()
     return (now - date).days > days
 
+def get_not_recent_mask(upload_dates: np.ndarray, days: int) -> np.ndarray:
+    """is_not_recent for a whole datetime64 column. Missing dates count as recent"""
+    now = np.datetime64(datetime.datetime.now(), "s")
+    # more than `days` whole days old
+    return (now - upload_dates) >= np.timedelta64(days + 1, "D")
+
+@memoize_files("data/full_data.json")
 def load_full_data():
-    global _cached_full_data
-    if _cached_full_data is not None:
-        return _cached_full_data
-    with open("data/full_data.json", "r", encoding="utf-8") as f:
-        _cached_full_data = json.load(f)
-    
-    _cached_full_data = [Sketch(**sketch) for sketch in _cached_full_data["full_data"] if is_not_recent(sketch["upload_date"], 1000)]
-    return _cached_full_data
+    sketches = columns_to_sketches(load_full_data_columns())
+    return [sketch for sketch in sketches if is_not_recent(sketch.upload_date, 1000)]
+
+
+@memoize_files("data/full_data.json")
+def load_sketch_table(mmap: bool = False) -> SketchTable:
+    """The same sketches as load_full_data, as a SketchTable"""
+    table = SketchTable(load_full_data_columns(mmap=mmap))
+    not_recent = get_not_recent_mask(table.get_values("upload_date"), 1000)
+    # taking rows copies every column, so a memory mapped table is only copied when rows are actually dropped
+    return table if not_recent.all() else table.take(not_recent)
+
+
+def load_full_data_columns(mmap: bool = False) -> dict:
+    """Returns the full data as typed columns (see analysis/columnar.py), memory mapped if mmap.
+    Unlike load_full_data, recent sketches aren't filtered out.
+    The columns are rebuilt from full_data.json when they are missing or older than it"""
+    if is_stale(FULL_DATA_COLUMNS_PATH, "data/full_data.json"):
+        with open("data/full_data.json", "r", encoding="utf-8") as f:
+            full_data = json.load(f)
+        save_sketch_columns([Sketch(**sketch) for sketch in full_data["full_data"]])
+    return load_columns(FULL_DATA_COLUMNS_PATH, mmap=mmap)
 if __name__ == '__main__':
     print(load_scene_data())
\ No newline at end of file
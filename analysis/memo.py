@@ -0,0 +1,107 @@
+import functools
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+DEFAULT_MAX_ENTRIES = 64
+
+
+class MemoCache:
+    """Least recently used store of memoized results. Every entry remembers what it was computed from
+    (the versions of the files it read, or the data object it was given) and is only reused while that still holds"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, source, compute: Callable):
+        """The value stored under key if it was computed from source, otherwise compute() stored in its place"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and _is_same_source(entry[0], source):
+                self._entries.move_to_end(key)
+                return entry[1]
+        # computed outside the lock so that slow loads don't block other lookups
+        value = compute()
+        with self._lock:
+            self._entries[key] = (source, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, path: str = None):
+        """Drops the entries that read the file at path, or every entry without one"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            path = os.path.abspath(path)
+            for key, (source, _) in list(self._entries.items()):
+                if isinstance(source, _FileVersions) and any(version[0] == path for version in source):
+                    del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _FileVersions(tuple):
+    """(absolute path, modification time, size) of each file an entry was loaded from, None for missing files"""
+
+
+_cache = MemoCache()
+
+
+def memoize_files(*paths: str):
+    """Memoizes a loader by its arguments and by the version of the files it reads. Editing, replacing or
+    deleting any of the files makes the next call load them again. Callers share the returned object, so they
+    shouldn't change it without writing the file back"""
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+            return _cache.get(key, get_file_versions(paths), lambda: func(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def memoize_derived(func: Callable) -> Callable:
+    """Memoizes a function of a dataset (its first argument, compared by identity) and any further hashable arguments.
+    The entry holds onto the dataset, so the dataset shouldn't be changed in place while it is cached"""
+
+    @functools.wraps(func)
+    def wrapper(data, *args, **kwargs):
+        key = (func.__module__, func.__qualname__, id(data), args, tuple(sorted(kwargs.items())))
+        return _cache.get(key, data, lambda: func(data, *args, **kwargs))
+
+    return wrapper
+
+
+def get_file_versions(paths) -> _FileVersions:
+    versions = []
+    for path in paths:
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            versions.append((path, None))
+            continue
+        versions.append((path, (stat.st_mtime_ns, stat.st_size)))
+    return _FileVersions(versions)
+
+
+def invalidate(path: str = None):
+    """Forgets what was memoized from the file at path, or everything that was memoized"""
+    _cache.invalidate(path)
+
+
+def _is_same_source(stored, source) -> bool:
+    if isinstance(stored, _FileVersions):
+        return stored == source
+    # datasets are compared by identity: the entry keeps its dataset alive, so its id can't be reused by another object
+    return stored is source
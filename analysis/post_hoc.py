@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+METHODS = ("lsd", "tukey")
+CORRECTIONS = (None, "holm")
+# the studentized range distribution takes milliseconds per value, so with more pairs than this tukey p-values are
+# interpolated from this many values of it instead (the rejections always use its exact critical value)
+TUKEY_GRID_SIZE = 128
+
+
+class PairwiseComparisons:
+    """Post hoc comparisons of every pair of groups. Entry [i, j] of each matrix compares group i with group j:
+    the difference of their means, the smallest significant difference, the p-value and whether the null is rejected"""
+
+    def __init__(self, labels: list, difference: np.ndarray, threshold: np.ndarray, p_values: np.ndarray, reject: np.ndarray):
+        self.labels = labels
+        self.difference = difference
+        self.threshold = threshold
+        self.p_values = p_values
+        self.reject = reject
+
+    def get_rejected_pairs(self) -> list:
+        """Every pair of groups with a significant difference, once each"""
+        first, second = np.nonzero(np.triu(self.reject, k=1))
+        return [(self.labels[i], self.labels[j]) for i, j in zip(first.tolist(), second.tolist())]
+
+    def get_greater_than(self) -> dict:
+        """For every group with a significantly higher mean than some others, those other groups"""
+        greater = self.reject & (self.difference > 0)
+        return {
+            label: [self.labels[j] for j in np.flatnonzero(row).tolist()]
+            for label, row in zip(self.labels, greater)
+            if row.any()
+        }
+
+    def to_frame(self) -> pd.DataFrame:
+        """One row per ordered pair of different groups"""
+        first, second = np.nonzero(~np.eye(len(self.labels), dtype=bool))
+        labels = np.asarray(self.labels, dtype=object)
+        return pd.DataFrame(
+            {
+                "group1": labels[first],
+                "group2": labels[second],
+                "difference": self.difference[first, second],
+                "threshold": self.threshold[first, second],
+                "p_value": self.p_values[first, second],
+                "reject_null": self.reject[first, second],
+            }
+        )
+
+
+def compare_pairs(
+    means: np.ndarray,
+    sizes: np.ndarray,
+    mse: float,
+    residual_df: float,
+    labels: list = None,
+    method: str = "lsd",
+    correction: str = None,
+    alpha: float = 0.05,
+) -> PairwiseComparisons:
+    """Compares every pair of groups from their means, sizes and the ANOVA's mean squared error, all at once.
+    method is Fisher's LSD ("lsd") or Tukey's HSD ("tukey", Tukey-Kramer for unequal sizes).
+    With correction="holm", p-values are Holm adjusted over the pairs and rejections follow the adjusted p-values,
+    while threshold stays the uncorrected one"""
+    if method not in METHODS:
+        raise ValueError(f"unknown post hoc method {method}, expected one of {METHODS}")
+    if correction not in CORRECTIONS:
+        raise ValueError(f"unknown correction {correction}, expected one of {CORRECTIONS}")
+    means = np.asarray(means, dtype=np.float64)
+    sizes = np.asarray(sizes, dtype=np.float64)
+    labels = list(range(len(means))) if labels is None else list(labels)
+    num_groups = len(means)
+
+    difference = means[:, None] - means[None, :]
+    standard_error = np.sqrt(mse * (1 / sizes[:, None] + 1 / sizes[None, :]))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        statistic = np.abs(difference) / standard_error
+    if method == "lsd":
+        threshold = stats.t.ppf(1 - alpha / 2, residual_df) * standard_error
+        p_values = 2 * stats.t.sf(statistic, residual_df)
+    else:
+        # the studentized range is in units of the standard error of one mean, a factor sqrt(2) off from the t statistic
+        critical_range = stats.studentized_range.ppf(1 - alpha, num_groups, residual_df)
+        threshold = critical_range * standard_error / np.sqrt(2)
+        p_values = _get_tukey_p_values(statistic * np.sqrt(2), num_groups, residual_df)
+    np.fill_diagonal(p_values, 1.0)
+
+    if correction == "holm":
+        first, second = np.triu_indices(num_groups, k=1)
+        adjusted = holm_adjust(p_values[first, second])
+        p_values[first, second] = adjusted
+        p_values[second, first] = adjusted
+        reject = p_values <= alpha
+    else:
+        reject = np.abs(difference) >= threshold
+    np.fill_diagonal(reject, False)
+    return PairwiseComparisons(labels, difference, threshold, p_values, reject)
+
+
+def holm_adjust(p_values: np.ndarray) -> np.ndarray:
+    """Holm-Bonferroni adjusted p-values, in the same order"""
+    p_values = np.asarray(p_values, dtype=np.float64)
+    order = np.argsort(p_values, kind="stable")
+    scaled = p_values[order] * (len(p_values) - np.arange(len(p_values)))
+    adjusted = np.empty_like(p_values)
+    adjusted[order] = np.minimum(np.maximum.accumulate(scaled), 1.0)
+    return adjusted
+
+
+def get_mse(sizes: np.ndarray, variances: np.ndarray) -> tuple:
+    """The ANOVA's mean squared error and its degrees of freedom, from each group's size and variance (with ddof=1)"""
+    sizes = np.asarray(sizes, dtype=np.float64)
+    residual_df = sizes.sum() - len(sizes)
+    return np.sum((sizes - 1) * np.asarray(variances, dtype=np.float64)) / residual_df, residual_df
+
+
+def _get_tukey_p_values(ranges: np.ndarray, num_groups: int, residual_df: float) -> np.ndarray:
+    first, second = np.triu_indices(num_groups, k=1)
+    pair_ranges = ranges[first, second]
+    if len(pair_ranges) <= TUKEY_GRID_SIZE:
+        pair_p_values = stats.studentized_range.sf(pair_ranges, num_groups, residual_df)
+    else:
+        # the survival function is smooth and decreasing, so its log interpolates closely between grid points
+        grid = np.linspace(0, np.nanmax(pair_ranges), TUKEY_GRID_SIZE)
+        log_sf = np.log(np.maximum(stats.studentized_range.sf(grid, num_groups, residual_df), np.finfo(float).tiny))
+        pair_p_values = np.exp(np.interp(pair_ranges, grid, log_sf))
+    p_values = np.ones((num_groups, num_groups))
+    p_values[first, second] = pair_p_values
+    p_values[second, first] = pair_p_values
+    return p_values
@@ -1,13 +1,329 @@
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer, BOOSTER_DICT, C_INCR, N_SCALAR, NEGATE, SPECIAL_CASES
+import itertools
+import string
 import numpy as np
+from typing import Optional
 
-analyzer = SentimentIntensityAnalyzer()
+analyzer = None
+vectorized_analyzer = None
+
+def init_sentiment_worker():
+    """Builds the analyzers once per process. Pass this as the initializer of any pool that scores comments"""
+    global analyzer, vectorized_analyzer
+    if analyzer is None:
+        analyzer = SentimentIntensityAnalyzer()
+    if vectorized_analyzer is None:
+        vectorized_analyzer = VectorizedSentimentAnalyzer(analyzer)
 
 def score_comment_sentiment(comment: str) -> float:
+    init_sentiment_worker()
     return analyzer.polarity_scores(comment)['compound']
 
+def score_comments_batch(comments: list, vectorized: bool = True) -> np.ndarray:
+    """Scores a whole chunk of comments in one call, so a pool pays its task overhead per chunk instead of per comment.
+    Uses the vectorized engine unless vectorized is False, in which case every comment goes through vaderSentiment itself"""
+    init_sentiment_worker()
+    if vectorized:
+        return vectorized_analyzer.score(comments)
+    return np.array([analyzer.polarity_scores(comment)['compound'] for comment in comments], dtype=float)
+
+
+def get_parity_mismatches(comments: list, tolerance: float = 1e-4) -> list:
+    """Scores comments with both engines and returns (comment, reference score, vectorized score) for every disagreement"""
+    reference = score_comments_batch(comments, vectorized=False)
+    vectorized = score_comments_batch(comments)
+    return [
+        (comments[i], reference[i], vectorized[i])
+        for i in np.flatnonzero(np.abs(reference - vectorized) > tolerance)
+    ]
+
+
+class VectorizedSentimentAnalyzer:
+    """Gives the same compound scores as vaderSentiment's polarity_scores, for a whole batch of comments at once.
+
+    Every token of the batch is mapped to a word id through a table built once from the lexicon, then VADER's
+    booster, negation, idiom, "but" and punctuation rules are applied to all tokens together with array operations.
+    Looking back at preceding words is done by shifting the token arrays, masked at comment boundaries"""
+
+    # distinct raw tokens to remember before the token table is reset
+    MAX_CACHED_TOKENS = 500_000
+
+    def __init__(self, reference: SentimentIntensityAnalyzer = None):
+        reference = reference if reference is not None else SentimentIntensityAnalyzer()
+        # polarity_scores only ever replaces single character emojis
+        self._emoji_table = str.maketrans({
+            emoji: " " + description for emoji, description in reference.emojis.items() if len(emoji) == 1
+        })
+
+        words = set(reference.lexicon) | set(BOOSTER_DICT) | set(NEGATE)
+        words.update(["no", "kind", "of", "least", "at", "very", "never", "so", "this", "without", "doubt", "or", "nor", "but"])
+        for n_gram in itertools.chain(SPECIAL_CASES, BOOSTER_DICT):
+            words.update(n_gram.split())
+        # id 0 is every word that none of the rules care about
+        self._word_ids = {word: i + 1 for i, word in enumerate(sorted(words))}
+        self._vocabulary_size = len(self._word_ids) + 1
+
+        self._in_lexicon = np.zeros(self._vocabulary_size, dtype=bool)
+        self._valence = np.zeros(self._vocabulary_size)
+        self._is_booster = np.zeros(self._vocabulary_size, dtype=bool)
+        self._booster = np.zeros(self._vocabulary_size)
+        for word, word_id in self._word_ids.items():
+            if word in reference.lexicon:
+                self._in_lexicon[word_id] = True
+                self._valence[word_id] = reference.lexicon[word]
+            if word in BOOSTER_DICT:
+                self._is_booster[word_id] = True
+                self._booster[word_id] = BOOSTER_DICT[word]
+        self._special_cases = self._build_n_gram_table(SPECIAL_CASES)
+        self._booster_n_grams = self._build_n_gram_table(BOOSTER_DICT)
+
+        # raw token -> word id * 4 + is all caps * 2 + is a negation
+        self._token_codes = {}
+
+    def score(self, comments: list) -> np.ndarray:
+        texts = [str(comment).translate(self._emoji_table) for comment in comments]
+        tokens = [text.split() for text in texts]
+        lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+        flat_tokens = list(itertools.chain.from_iterable(tokens))
+
+        if len(self._token_codes) > self.MAX_CACHED_TOKENS:
+            self._token_codes.clear()
+        for token in set(flat_tokens).difference(self._token_codes):
+            self._token_codes[token] = self._encode_token(token)
+        codes = np.fromiter(map(self._token_codes.__getitem__, flat_tokens), dtype=np.int64, count=len(flat_tokens))
+
+        sums = self._sum_valences(codes >> 2, (codes & 2).astype(bool), (codes & 1).astype(bool), lengths)
+        exclamations = np.minimum([text.count("!") for text in texts], 4)
+        questions = np.array([text.count("?") for text in texts])
+        emphasis = exclamations * 0.292 + np.where(questions > 1, np.where(questions <= 3, questions * 0.18, 0.96), 0)
+        sums = sums + np.sign(sums) * emphasis
+        compound = np.clip(sums / np.sqrt(sums * sums + 15), -1.0, 1.0)
+        return np.round(compound, 4)
+
+    def _encode_token(self, token: str) -> int:
+        # punctuation is only stripped off words, so emoticons like ":)" survive
+        stripped = token.strip(string.punctuation)
+        word = token if len(stripped) <= 2 else stripped
+        lower = word.lower()
+        is_negation = lower in NEGATE or "n't" in lower
+        return self._word_ids.get(lower, 0) * 4 + word.isupper() * 2 + is_negation
+
+    def _sum_valences(self, words: np.ndarray, is_upper: np.ndarray, is_negation: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """Sums the valence of every token of each comment, mirroring SentimentIntensityAnalyzer.sentiment_valence"""
+        ids = self._word_ids
+        comment = np.repeat(np.arange(len(lengths)), lengths)
+        starts = np.cumsum(lengths) - lengths
+        position = np.arange(len(words)) - starts[comment]
+        remaining = lengths[comment] - position - 1
+        # the words before and after each token, with id 0 where they would cross into another comment
+        previous = [words] + [_shift(words, k, position >= k) for k in (1, 2, 3)]
+        previous_upper = [is_upper] + [_shift(is_upper, k, position >= k) for k in (1, 2, 3)]
+        previous_negation = [is_negation] + [_shift(is_negation, k, position >= k) for k in (1, 2, 3)]
+        following = [words] + [_shift(words, -k, remaining >= k) for k in (1, 2)]
+
+        upper_counts = np.bincount(comment, weights=is_upper, minlength=len(lengths))
+        is_cap_diff = ((upper_counts > 0) & (upper_counts < lengths))[comment]
+
+        scored = self._in_lexicon[words] & ~self._is_booster[words] & ~((words == ids["kind"]) & (following[1] == ids["of"]))
+        valence = np.where((words == ids["no"]) & self._in_lexicon[following[1]], 0.0, self._valence[words])
+        after_no = (
+            (previous[1] == ids["no"])
+            | (previous[2] == ids["no"])
+            | ((previous[3] == ids["no"]) & ((previous[1] == ids["or"]) | (previous[1] == ids["nor"])))
+        )
+        valence = np.where(after_no, self._valence[words] * N_SCALAR, valence)
+        valence = np.where(is_upper & is_cap_diff, np.where(valence > 0, valence + C_INCR, valence - C_INCR), valence)
+
+        so_or_this = [(word == ids["so"]) | (word == ids["this"]) for word in previous]
+        for k, dampening in ((1, 1.0), (2, 0.95), (3, 0.9)):
+            applies = (position >= k) & ~self._in_lexicon[previous[k]]
+            scalar = np.where(valence < 0, -self._booster[previous[k]], self._booster[previous[k]])
+            capitalized = self._is_booster[previous[k]] & previous_upper[k] & is_cap_diff
+            scalar = np.where(capitalized, np.where(valence > 0, scalar + C_INCR, scalar - C_INCR), scalar)
+            valence = np.where(applies, valence + scalar * dampening, valence)
+
+            if k == 1:
+                intensified = np.zeros(len(words), dtype=bool)
+                kept = intensified
+            elif k == 2:
+                intensified = (previous[2] == ids["never"]) & so_or_this[1]
+                kept = (previous[2] == ids["without"]) & (previous[1] == ids["doubt"])
+            else:
+                intensified = ((previous[3] == ids["never"]) & so_or_this[2]) | so_or_this[1]
+                kept = (previous[3] == ids["without"]) & ((previous[2] == ids["doubt"]) | (previous[1] == ids["doubt"]))
+            negated = previous_negation[k] & ~intensified & ~kept
+            valence = np.where(applies & intensified, valence * 1.25, valence)
+            valence = np.where(applies & negated, valence * N_SCALAR, valence)
+
+        valence = np.where((position >= 3) & ~self._in_lexicon[previous[3]], self._check_idioms(valence, previous, following), valence)
+
+        after_least = (previous[1] == ids["least"]) & ~self._in_lexicon[previous[1]]
+        least_negated = after_least & ((position == 1) | ((previous[2] != ids["at"]) & (previous[2] != ids["very"])))
+        valence = np.where(least_negated, valence * N_SCALAR, valence)
+        sentiments = np.where(scored, valence, 0.0)
+
+        # only the first "but" of a comment counts
+        is_but = words == ids["but"]
+        first_but = np.full(len(lengths), np.iinfo(np.int64).max)
+        np.minimum.at(first_but, comment[is_but], position[is_but])
+        for i in np.unique(comment[is_but]):
+            start, end = starts[i], starts[i] + lengths[i]
+            sentiments[start:end] = _check_but(sentiments[start:end].tolist(), first_but[i])
+        return np.bincount(comment, weights=sentiments, minlength=len(lengths))
+
+    def _check_idioms(self, valence: np.ndarray, previous: list, following: list) -> np.ndarray:
+        """Vectorized SentimentIntensityAnalyzer._special_idioms_check"""
+        # the first matching sequence wins, so apply them last to first
+        sequences = [
+            (previous[1], previous[0]),
+            (previous[2], previous[1], previous[0]),
+            (previous[2], previous[1]),
+            (previous[3], previous[2], previous[1]),
+            (previous[3], previous[2]),
+        ]
+        for sequence in reversed(sequences):
+            found, values = self._look_up(self._special_cases, sequence)
+            valence = np.where(found, values, valence)
+        for sequence in [(following[0], following[1]), (following[0], following[1], following[2])]:
+            found, values = self._look_up(self._special_cases, sequence)
+            valence = np.where(found, values, valence)
+        for sequence in [(previous[3], previous[2], previous[1]), (previous[3], previous[2]), (previous[2], previous[1])]:
+            found, values = self._look_up(self._booster_n_grams, sequence)
+            valence = np.where(found, valence + values, valence)
+        return valence
+
+    def _build_n_gram_table(self, mapping: dict) -> dict:
+        """Maps each n-gram length to the sorted codes of the n-grams with that many words and their values"""
+        by_length = {}
+        for n_gram, value in mapping.items():
+            n_gram_words = n_gram.split()
+            if len(n_gram_words) > 1:
+                code = self._encode_n_gram([self._word_ids[word] for word in n_gram_words])
+                by_length.setdefault(len(n_gram_words), []).append((code, value))
+        table = {}
+        for length, entries in by_length.items():
+            entries.sort()
+            table[length] = (np.array([code for code, _ in entries], dtype=np.int64), np.array([value for _, value in entries]))
+        return table
+
+    def _encode_n_gram(self, word_ids):
+        code = 0
+        for word_id in word_ids:
+            code = code * self._vocabulary_size + word_id
+        return code
+
+    def _look_up(self, table: dict, sequence: tuple) -> tuple:
+        if len(sequence) not in table:
+            return np.zeros(len(sequence[0]), dtype=bool), np.zeros(len(sequence[0]))
+        codes, values = table[len(sequence)]
+        sequence_codes = self._encode_n_gram([word_ids.astype(np.int64) for word_ids in sequence])
+        index = np.minimum(np.searchsorted(codes, sequence_codes), len(codes) - 1)
+        # ids of 0 never take part in an n-gram, so words past a comment's edge can't match
+        return codes[index] == sequence_codes, values[index]
+
+
+def _check_but(sentiments: list, but_index: int) -> list:
+    """SentimentIntensityAnalyzer._but_check: words before the "but" count half as much, and words after it half again as much.
+    It finds each score with list.index, so a score equal to an earlier one that was already scaled scales that one again
+    instead. The outcome depends on that order, so it stays a loop (only comments containing "but" get here)"""
+    for sentiment in sentiments:
+        i = sentiments.index(sentiment)
+        if i < but_index:
+            sentiments[i] = sentiment * 0.5
+        elif i > but_index:
+            sentiments[i] = sentiment * 1.5
+    return sentiments
+
+
+def _shift(values: np.ndarray, k: int, valid: np.ndarray) -> np.ndarray:
+    """values[i - k] at every i (values[i + |k|] for negative k), zeroed wherever valid is False"""
+    shifted = np.zeros_like(values)
+    if k > 0:
+        shifted[k:] = values[:-k]
+    else:
+        shifted[:k] = values[-k:]
+    shifted[~valid] = 0
+    return shifted
+
+class SentimentAggregator:
+    """Running statistics of sentiment scores that are folded in batch by batch, so the raw scores can be discarded.
+    Batches are merged with Chan et al.'s parallel form of Welford's algorithm"""
+
+    def __init__(self, bins: int = 20):
+        self.count = 0
+        self.mean = float("nan")
+        self.min = float("nan")
+        self.max = float("nan")
+        self._m2 = 0.0
+        # compound scores are always in [-1, 1]
+        self.bin_edges = np.linspace(-1, 1, bins + 1)
+        self.histogram = np.zeros(bins, dtype=int)
+
+    def add(self, scores: np.ndarray):
+        if len(scores) == 0:
+            return
+        batch_count = len(scores)
+        batch_mean = float(scores.mean())
+        batch_m2 = ((scores - batch_mean) ** 2).sum()
+        if self.count == 0:
+            self.mean, self._m2 = batch_mean, batch_m2
+            self.min, self.max = scores.min(), scores.max()
+        else:
+            total = self.count + batch_count
+            delta = batch_mean - self.mean
+            self.mean += delta * batch_count / total
+            self._m2 += batch_m2 + delta ** 2 * self.count * batch_count / total
+            self.min = min(self.min, scores.min())
+            self.max = max(self.max, scores.max())
+        self.count += batch_count
+        self.histogram += np.histogram(scores, bins=self.bin_edges)[0]
+
+    @property
+    def variance(self) -> float:
+        # population variance, like np.var
+        return self._m2 / self.count if self.count > 0 else float("nan")
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.variance))
+
+
+class SamplingPolicy:
+    """Decides when enough of a video's comments have been scored.
+    Stops at max_comments, or once the standard error of the running mean drops below target_standard_error
+    (after at least min_comments, so a few early pages that happen to agree don't end it).
+    Comments come newest first, so a stopped video's stats describe its newest comments rather than a random sample"""
+
+    def __init__(self, max_comments: int = None, target_standard_error: float = None, min_comments: int = 200):
+        self.max_comments = max_comments
+        self.target_standard_error = target_standard_error
+        self.min_comments = min_comments
+
+    def remaining(self, num_fetched: int) -> Optional[int]:
+        """How many more comments may be fetched under the cap, or None if there is no cap"""
+        if self.max_comments is None:
+            return None
+        return max(self.max_comments - num_fetched, 0)
+
+    def should_stop(self, num_fetched: int, aggregator: SentimentAggregator) -> bool:
+        if self.remaining(num_fetched) == 0:
+            return True
+        if self.target_standard_error is None or aggregator.count < self.min_comments:
+            return False
+        return get_standard_error(aggregator.std, aggregator.count) < self.target_standard_error
+
+
+def get_standard_error(std: float, count: int) -> float:
+    return float(std / np.sqrt(count)) if count > 0 else float("nan")
+
+
+def get_confidence_interval_width(std: float, count: int, z: float = 1.96) -> float:
+    """Full width of the (default 95%) normal confidence interval for the mean"""
+    return 2 * z * get_standard_error(std, count)
+
+
 def get_sentiment_stats(strings: list) -> dict:
-    sentiments = np.array([score_comment_sentiment(string) for string in strings])
+    sentiments = score_comments_batch(strings)
     data = {"mean": sentiments.mean(), "standard_dev": sentiments.std()}
     return data
 
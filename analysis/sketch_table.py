@@ -0,0 +1,163 @@
+import numpy as np
+import scipy.sparse as sparse
+from typing import Iterator, List, Union
+from schema import Sketch
+from analysis.memo import memoize_derived
+from analysis.columnar import SKETCH_COLUMN_KINDS, columns_to_sketches, count_rows, decode_column, encode_columns
+
+
+class SketchTable:
+    """Sketches as a struct of arrays instead of a list of Sketch models.
+
+    Numeric fields are NumPy arrays with a validity mask in place of None, scene_type (like the other categorical
+    fields) holds integer codes into its list of categories, and cast is CSR style: the actor ids of every sketch
+    back to back, with sketch i's cast at cast_ids[cast_offsets[i]:cast_offsets[i + 1]].
+    The columns use the layout of analysis/columnar.py, so a stored (or memory mapped) copy is used as is"""
+
+    def __init__(self, columns: dict):
+        self.columns = columns
+        self._num_rows = count_rows(columns, SKETCH_COLUMN_KINDS)
+        # Python values of the fields that rows have been read from, decoded once per field
+        self._decoded = {}
+        self._actor_incidence = None
+
+    @classmethod
+    def from_sketches(cls, sketches: List[Sketch]) -> "SketchTable":
+        return cls(encode_columns(sketches, SKETCH_COLUMN_KINDS, getattr))
+
+    def to_sketches(self) -> List[Sketch]:
+        return columns_to_sketches(self.columns)
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def __iter__(self) -> Iterator["SketchRow"]:
+        return (SketchRow(self, row) for row in range(self._num_rows))
+
+    def __getitem__(self, row: int) -> "SketchRow":
+        if not -self._num_rows <= row < self._num_rows:
+            raise IndexError("sketch table index out of range")
+        return SketchRow(self, row % self._num_rows)
+
+    @property
+    def scene_type_codes(self) -> np.ndarray:
+        return self.columns["scene_type"]
+
+    @property
+    def scene_types(self) -> list:
+        return self.columns["scene_type.categories"].tolist()
+
+    @property
+    def cast_ids(self) -> np.ndarray:
+        return self.columns["cast"]
+
+    @property
+    def cast_offsets(self) -> np.ndarray:
+        return self.columns["cast.offsets"]
+
+    @property
+    def actors(self) -> list:
+        return self.columns["cast.categories"].tolist()
+
+    @property
+    def actor_incidence(self) -> sparse.csr_matrix:
+        """Actor x sketch matrix with a 1 where the actor is in the sketch's cast, built on first use.
+        Rows follow self.actors and columns follow the rows of the table"""
+        if self._actor_incidence is None:
+            ids = np.asarray(self.cast_ids)
+            by_sketch = sparse.csr_matrix(
+                (np.ones(len(ids)), ids, np.asarray(self.cast_offsets)), shape=(self._num_rows, len(self.actors))
+            )
+            # an actor listed twice in one cast still only appears in it once
+            by_sketch.sum_duplicates()
+            by_sketch.data[:] = 1
+            self._actor_incidence = by_sketch.T.tocsr()
+        return self._actor_incidence
+
+    def is_numeric(self, field: str) -> bool:
+        return SKETCH_COLUMN_KINDS.get(field) in ("int", "float")
+
+    def get_values(self, field: str) -> np.ndarray:
+        """The raw column of a field. Where get_mask is False the value is a placeholder (0, NaN or NaT)"""
+        return self.columns[field]
+
+    def get_mask(self, field: str) -> np.ndarray:
+        """True for every row where the field isn't None"""
+        kind = SKETCH_COLUMN_KINDS[field]
+        column = self.columns[field]
+        if kind == "int":
+            return np.asarray(self.columns[field + ".mask"])
+        if kind == "float":
+            return ~np.isnan(column)
+        if kind == "category":
+            return column >= 0
+        if kind in ("date", "datetime"):
+            return ~np.isnat(column)
+        return np.ones(self._num_rows, dtype=bool)
+
+    def get_numeric_values(self, field: str) -> tuple:
+        """A numeric field as float64 values and its mask, raising TypeError for other fields"""
+        if not self.is_numeric(field):
+            raise TypeError("Attribute " + field + " is not numeric")
+        return np.asarray(self.get_values(field), dtype=np.float64), self.get_mask(field)
+
+    def get_value(self, field: str, row: int):
+        values = self._decoded.get(field)
+        if values is None:
+            values = self._decoded[field] = decode_column(self.columns, field, SKETCH_COLUMN_KINDS[field])
+        return values[row]
+
+    def take(self, rows: np.ndarray) -> "SketchTable":
+        """A new table of the given rows, selected by index or by boolean mask"""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        columns = {}
+        for field, kind in SKETCH_COLUMN_KINDS.items():
+            if kind == "category_list":
+                offsets = self.columns[field + ".offsets"]
+                starts = offsets[rows]
+                lengths = offsets[rows + 1] - starts
+                new_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+                # position of every kept item in the old flat array
+                items = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+                columns[field] = self.columns[field][items]
+                columns[field + ".offsets"] = new_offsets
+            else:
+                columns[field] = self.columns[field][rows]
+                if kind == "int":
+                    columns[field + ".mask"] = self.columns[field + ".mask"][rows]
+            if kind in ("category", "category_list"):
+                columns[field + ".categories"] = self.columns[field + ".categories"]
+        return SketchTable(columns)
+
+
+class SketchRow:
+    """A read only view of one row of a SketchTable, with the same attributes as a Sketch"""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: SketchTable, row: int):
+        self._table = table
+        self._row = row
+
+    def __getattr__(self, field: str):
+        if field not in SKETCH_COLUMN_KINDS:
+            raise AttributeError(f"'SketchRow' object has no attribute '{field}'")
+        return self._table.get_value(field, self._row)
+
+    def to_sketch(self) -> Sketch:
+        return Sketch.model_construct(**{field: getattr(self, field) for field in SKETCH_COLUMN_KINDS})
+
+    def __repr__(self) -> str:
+        return f"SketchRow({self._row}, id={self.id!r}, title={self.title!r})"
+
+
+def as_sketch_table(data: Union[SketchTable, List[Sketch]]) -> SketchTable:
+    """Lets functions that used to take a list of sketches take either"""
+    return data if isinstance(data, SketchTable) else _get_sketch_table(data)
+
+
+@memoize_derived
+def _get_sketch_table(sketches: List[Sketch]) -> SketchTable:
+    return SketchTable.from_sketches(sketches)
@@ -1,16 +1,15 @@
 import scipy.stats as stats
 import numpy as np
-from analysis.load_data import load_full_data
-import statsmodels.api as sm # for ANOVA table
-from statsmodels.formula.api import ols # for ANOVA table
-import pandas as pd
+from analysis.load_data import load_sketch_table
+from analysis.actor_stats import get_actor_values
+from analysis.group_by import GroupBy
+from analysis.memo import memoize_derived
+from analysis.post_hoc import PairwiseComparisons, compare_pairs, get_mse
+from analysis.sketch_table import as_sketch_table
 
-stored_durations = None
-stored_scene_types = None
-stored_actors = None
 
 def test():
-    data = load_full_data()
+    data = load_sketch_table()
     attributes = ["view_count", "like_count", "comment_count", "mean_sentiment", "std_sentiment"]
     for attribute in attributes:
         _check_attribute_is_valid(data, attribute)
@@ -35,57 +34,30 @@ def test_group(data, attribute, group):
     # ANOVA test
     print("\n\tANOVA result:", end=" ")
     result = stats.f_oneway(*values.values())
-    # Fit the ANOVA model
-    values_for_df = [(value, key) for key, values in values.items() for value in values]
-    df = pd.DataFrame(values_for_df, columns=["value", "group"])
-    model = ols('value ~ group', data=df).fit()
-    anova_table = sm.stats.anova_lm(model, typ=2)
     if result.pvalue < 0.01:
         print("REJECT NULL (p-value < 0.01)")
         # Fisher's LSD test
-        results_table = pd.DataFrame(columns=["group1", "group2", "reject_null"])
-        results_dict = {} # key is group1, value is list of group2 that rejects null
-        rejects = set()
-        key_list = list(values.keys())
-        for i in range(len(values)):
-            key1 = key_list[i]
-            for j in range(len(values)):
-                key2 = key_list[j]
-                if i != j:
-                    if fisher_lsd(values, anova_table, key1, key2, alpha=0.005):
-                        # print("\t\t" + key1 + " vs " + key2 + ": REJECT NULL")
-                        rejects.add(frozenset([key1, key2])) # use frozenset so that order doesn't matter
-                        if key1 in results_dict:
-                            results_dict[key1].append(key2)
-                        else:
-                            results_dict[key1] = [key2]
-                        results_table = results_table._append({"group1": key1, "group2": key2, "reject_null": "REJECT"}, ignore_index=True)
-                    else:
-                        # print("\t\t" + key1 + " vs " + key2 + ": FAIL TO REJECT NULL")
-                        results_table = results_table._append({"group1": key1, "group2": key2, "reject_null": "FAIL TO REJECT"}, ignore_index=True)
+        comparisons = fisher_lsd(values, alpha=0.005)
+        rejects = comparisons.get_rejected_pairs()
+        results_dict = comparisons.get_greater_than() # key is group1, value is list of group2 that rejects null
         print("\n\tFisher LSD: rejects null for " + str(len(rejects)) + " pairs of groups")
         # print results dict
         for key, value in results_dict.items():
-            print("\t\t" + key + ": " + str(len(value))+ " groups\n\t\t\t" + str(value))
+            print("\t\t" + str(key) + ": " + str(len(value))+ " groups\n\t\t\t" + str(value))
         # print("No duplicates:", len(fisher_rejects) == len(set(map(tuple, fisher_rejects)))) # Check for duplicates
     else:
         print("FAIL TO REJECT NULL (p-value > 0.01)")
     # print("\t\tANOVA statistic=" + str(result.statistic) + "\n\t\tp-value=" + str(result.pvalue) + "\n")
 
 
-# get the result for Fisher LSD test
-# return true if there is significant data to reject the null hypothesis
-def fisher_lsd(values, anova_table, key1, key2, alpha=0.05):
-    residual_df = anova_table['df']['Residual']
-    t025 = stats.t.ppf(1 - (alpha / 2), residual_df)
-    residual_sum_of_squares = anova_table['sum_sq']['Residual']
-    mse = residual_sum_of_squares / residual_df
-    # find LSD: LSD = t.025, DFw * √MSW(1/n1 + 1/n1)
-    lsd = t025 * np.sqrt(mse * ((1/len(values[key1])) + (1/len(values[key2]))))
-    # find mean difference
-    mean_difference = np.mean(values[key1]) - np.mean(values[key2])
-    # return true if mean difference is greater than LSD (reject null hypothesis)
-    return mean_difference >= lsd
+# get the result for Fisher LSD test (or Tukey HSD with method="tukey") for every pair of groups at once
+# a pair rejects the null hypothesis if the difference of its means is at least the LSD
+def fisher_lsd(values, alpha=0.05, method="lsd", correction=None) -> PairwiseComparisons:
+    means = [np.mean(group_values) for group_values in values.values()]
+    sizes = [len(group_values) for group_values in values.values()]
+    # the ANOVA's mean squared error, pooled from the group variances
+    mse, residual_df = get_mse(sizes, [np.var(group_values, ddof=1) for group_values in values.values()])
+    return compare_pairs(means, sizes, mse, residual_df, list(values), method=method, correction=correction, alpha=alpha)
 
 
 def _get_all_attribute_values_for_durations(data, attribute) -> dict:
@@ -98,10 +70,8 @@ def _get_all_attribute_values_for_durations(data, attribute) -> dict:
             value_dict[d] = attribute_values
     return value_dict
 
+@memoize_derived
 def _get_durations(data) -> list:
-    global stored_durations
-    if stored_durations is not None:
-        return stored_durations
     durations = []
     for d in data:
         durations.append(d.duration)
@@ -127,59 +97,15 @@ def _get_duration_attribute_values(data, attribute, duration) -> list:
 
 
 def _get_all_attribute_values_for_scene_types(data, attribute) -> dict:
-    scene_types = _get_scene_types(data)
-    value_dict = {} # key is scene type, value is list of attribute values
-    for scene_type in scene_types:
-        # add only if there are more than 2 sketches of this scene type
-        attribute_values = _get_scene_type_attribute_values(data, attribute, scene_type)
-        if len(attribute_values) > 2:
-            value_dict[scene_type] = attribute_values
-    return value_dict
-
-def _get_scene_types(data) -> set:
-    global stored_scene_types
-    if stored_scene_types is not None:
-        return stored_scene_types
-    scene_types = set()
-    for d in data:
-        scene_types.add(d.scene_type)
-    return scene_types
-
-def _get_scene_type_attribute_values(data, attribute, scene_type) -> list:
-    attribute_values = []
-    for d in data:
-        if d.scene_type == scene_type and getattr(d, attribute) is not None:
-            attribute_values.append(getattr(d, attribute))
-    return attribute_values
+    table = as_sketch_table(data)
+    values, mask = table.get_numeric_values(attribute)
+    # key is scene type, value is array of attribute values. add only if there are more than 2 sketches of this scene type
+    return GroupBy.from_field(table, "scene_type").get_group_values(values, mask, min_count=3)
 
 
 def _get_all_attribute_values_for_actors(data, attribute) -> dict:
-    actors = _get_actors(data)
-    value_dict = {} # key is actor, value is list of attribute values
-    for actor in actors:
-        # add only if there are more than 2 sketches of this actor
-        attribute_values = _get_actor_attribute_values(data, attribute, actor)
-        if len(attribute_values) > 2:
-            value_dict[actor] = attribute_values
-    return value_dict
-
-def _get_actors(data) -> set:
-    global stored_actors
-    if stored_actors is not None:
-        return stored_actors
-    actors = set()
-    for d in data:
-        for actor in d.cast:
-            if actor is not None:
-                actors.add(actor)
-    return actors
-
-def _get_actor_attribute_values(data, attribute, actor) -> list:
-    attribute_values = []
-    for d in data:
-        if actor in d.cast and getattr(d, attribute) is not None:
-            attribute_values.append(getattr(d, attribute))
-    return attribute_values
+    # key is actor, value is array of attribute values. add only if there are more than 2 sketches of this actor
+    return get_actor_values(data, attribute, min_appearances=3)
 
 
 def _check_attribute_is_valid(data, attribute):
@@ -3,9 +3,13 @@ from typing import List
 import multiprocessing
 from concurrent.futures import ProcessPoolExecutor
 import asyncio
+import contextlib
 import datetime
+import hashlib
+import itertools
 import json
 import logging
+import time
 import numpy as np
 import aiohttp
 from tqdm.asyncio import tqdm
@@ -13,16 +17,52 @@ from tqdm import tqdm as sync_tqdm
 from schema import Sketch
 from data_collection.snl_archive_scraper import (
     get_all_episode_urls,
-    get_scenes_from_episode_url,
+    get_episode_from_url,
+    get_episode_season,
 )
 from data_collection.youtube import (
     fetch_all_channel_videos,
-    fetch_video_statistics,
-    fetch_video_comments,
+    fetch_new_channel_videos,
+    fetch_video_statistics_async,
+    fetch_video_comment_threads,
 )
-from data_collection.fuzzy_search import get_matching_string
-from analysis.load_data import load_scene_data, load_video_data, load_full_data
-from analysis.sentiment import score_comment_sentiment
+from data_collection import http_cache
+from data_collection.comment_store import CommentScoreStore
+from data_collection.fuzzy_search import TitleMatcher
+from data_collection.scene_index import SceneIndex, pick_scene_by_cast_overlap
+from analysis.load_data import (
+    load_scene_columns,
+    load_episode_data,
+    load_video_data,
+    load_full_data,
+)
+from analysis.columnar import (
+    FULL_DATA_COLUMNS_PATH,
+    SCENE_COLUMN_KINDS,
+    decode_column,
+    save_scene_columns,
+    save_sketch_columns,
+)
+from analysis.comment_dedup import CommentDeduplicator, get_band_keys
+from analysis.sentiment import (
+    SamplingPolicy,
+    SentimentAggregator,
+    get_confidence_interval_width,
+    init_sentiment_worker,
+    score_comments_batch,
+)
+
+MATCH_CACHE_PATH = "data/match_cache.json"
+# bump whenever a change to matching (fuzzy_search.py, scene_index.py) would match any video differently,
+# so that matches cached by the old code are thrown away
+#   2: rerun Encore Presentation records never win over the original scene
+MATCHER_VERSION = 2
+MATCH_THRESHOLD = 0.8
+MATCH_NGRAM_SIZE = 3
+MATCH_MAX_CANDIDATES = 50
+MATCH_WINDOW_DAYS = 14
+MATCH_TIE_BREAK = pick_scene_by_cast_overlap
+COMMENT_PAGE_QUEUE_SIZE = 64
 
 
 async def main():
@@ -33,6 +73,17 @@ async def main():
         help="fetch up to date scene data instead of relying on stored data",
         action="store_true",
     )
+    parser.add_argument(
+        "--update-scenes",
+        help="only scrape episodes that aren't stored yet, plus the seasons given by --recheck-seasons",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--recheck-seasons",
+        help="number of most recent seasons to re-check for changes when using --update-scenes",
+        type=int,
+        default=0,
+    )
     parser.add_argument(
         "--refilter",
         help="re-filter stored videos based on title. This is done automatically if scenes or videos are re-scraped",
@@ -43,6 +94,11 @@ async def main():
         help="get ids and titles of all channel's videos from the youtube api",
         action="store_true",
     )
+    parser.add_argument(
+        "--sync-videos",
+        help="get only the channel's videos uploaded since the last --get-videos or --sync-videos",
+        action="store_true",
+    )
     parser.add_argument(
         "--get-stats",
         help="get all video statistics from the youtube api",
@@ -53,72 +109,92 @@ async def main():
         help="fetch and analyze video comment sentiment",
         action="store_true",
     )
+    parser.add_argument(
+        "--refresh-comments",
+        help="score only comments posted since the last analysis and update every video's sentiment",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max-comments",
+        help="score at most this many comments per video when analyzing comments. "
+        "The comments are the video's newest, so its sentiment only describes those",
+        type=int,
+    )
+    parser.add_argument(
+        "--target-sentiment-se",
+        help="stop scoring a video's comments once the standard error of its mean sentiment is below this. "
+        "Comments are scored newest first, so the error only covers the newest comments, not a random sample",
+        type=float,
+    )
+    parser.add_argument(
+        "--dedup-comments",
+        help="score exact duplicate comments of a video once and give every copy the same score",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--max-comment-copies",
+        help="leave exact or near copies of a comment past this many out of its video's sentiment as spam (implies --dedup-comments)",
+        type=int,
+    )
+    parser.add_argument(
+        "--http-cache",
+        help="store archive and youtube responses on disk and reuse them while they are fresh",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--offline",
+        help="replay stored responses from the http cache without making any network requests",
+        action="store_true",
+    )
     parser.add_argument("--all", "-a", help="re-collect all data", action="store_true")
 
     args = parser.parse_args()
 
+    if args.http_cache or args.offline:
+        http_cache.enable_cache(offline=args.offline)
+
     # Load or collect scene data
     if args.scrape_scenes or args.all:
         logging.info("Scraping scene data")
-        async with aiohttp.ClientSession() as session:
-            urls = await get_all_episode_urls(session)
-            print(f"found {len(urls)} episodes")
-            pbar = tqdm(total=len(urls), desc="Collecting scene data")
-
-            def on_complete(_):
-                pbar.update(1)
-
-            semaphore = asyncio.Semaphore(15)
-            tasks = [
-                asyncio.create_task(
-                    get_scenes_from_episode_url(url, session, semaphore)
-                )
-                for url in urls
-            ]
-
-            for task in tasks:
-                task.add_done_callback(on_complete)
-
-            episodes = await asyncio.gather(*tasks)
-        scenes = [
-            dict(scene)
-            for episode in episodes
-            if episode is not None
-            for scene in episode
-            if scene is not None
-        ]
-
-        with open("data/scenes.json", "w", encoding="utf-8") as f:
-            data = {
-                "last_updated": datetime.datetime.now().isoformat(),
-                "scene_data": scenes,
-            }
-            json.dump(data, f, indent=4)
-        logging.info("Saved scene data to file")
-    else:
-        scenes = load_scene_data()
-        logging.info("Loaded scene data from file")
+        await _scrape_scenes(incremental=False)
+    elif args.update_scenes:
+        logging.info("Scraping new and recent episodes")
+        await _scrape_scenes(incremental=True, recheck_seasons=args.recheck_seasons)
+    scene_columns = load_scene_columns()
+    logging.info("Loaded scene data from file")
 
     # Collect or load titles and ids of all SNL videos
     if args.get_videos or args.all:
         logging.info("Fetching channel videos from youtube")
         # collect titles and ids of all SNL videos
         channel_videos = _fetch_identification_for_all_videos("SaturdayNightLive")
-        with open("data/channel_videos.json", "w", encoding="utf-8") as f:
-            data = {
-                "last_updated": datetime.datetime.now().isoformat(),
-                "channel_videos": channel_videos,
-            }
-            json.dump(data, f, indent=4)
+        _save_channel_videos(channel_videos)
+    elif args.sync_videos:
+        logging.info("Syncing new channel videos from youtube")
+        stored_videos = load_video_data()
+        new_videos = fetch_new_channel_videos(
+            "SaturdayNightLive", {video["id"] for video in stored_videos}
+        )
+        print(f"found {len(new_videos)} new videos")
+        # both lists are newest first
+        channel_videos = new_videos + stored_videos
+        _save_channel_videos(channel_videos)
     else:
         # load titles and ids of all SNL videos
         channel_videos = load_video_data()
         logging.info("Loaded channel videos from file")
 
-    if args.refilter or args.all or args.scrape_scenes or args.get_videos:
+    if (
+        args.refilter
+        or args.all
+        or args.scrape_scenes
+        or args.update_scenes
+        or args.get_videos
+        or args.sync_videos
+    ):
         # match videos based on title (get video id, title, scene type, and cast)
         filtered_videos = _filter_videos(channel_videos)
-        sketch_data = _combine_archive_with_filtered_videos(scenes, filtered_videos)
+        sketch_data = _combine_archive_with_filtered_videos(scene_columns, filtered_videos)
         full_data = [Sketch(**sketch) for sketch in sketch_data]
     else:
         # load data from previous collection
@@ -126,21 +202,21 @@ async def main():
 
     # collect youtube data
     if args.get_stats or args.all:
-        video_stats = _fetch_youtube_stats(full_data)
-
-        for video in video_stats:
-            for sketch in full_data:
-                if video['video_id'] == sketch.id:
-                    sketch.view_count = video['view_count']
-                    sketch.like_count = video['like_count']
-                    sketch.comment_count = video['comment_count']
-                    sketch.duration = video['duration']
-                    sketch.upload_date = video['upload_date']
-                    break
+        await _fetch_youtube_stats(full_data)
 
     # Collect or load comment sentiment
+    sampling = None
+    if args.max_comments is not None or args.target_sentiment_se is not None:
+        sampling = SamplingPolicy(args.max_comments, args.target_sentiment_se)
+    deduplicate = args.dedup_comments or args.max_comment_copies is not None
     if args.analyze_comments or args.all:
-        await update_video_sentiment_stats(full_data)
+        await update_video_sentiment_stats(
+            full_data, sampling=sampling, deduplicate=deduplicate, max_copies=args.max_comment_copies
+        )
+    elif args.refresh_comments:
+        await update_video_sentiment_stats(
+            full_data, refresh=True, sampling=sampling, deduplicate=deduplicate, max_copies=args.max_comment_copies
+        )
 
     # Save final composite data
     with open("data/full_data.json", "w", encoding="utf-8") as f:
@@ -149,23 +225,115 @@ async def main():
             "full_data": [sketch.model_dump() for sketch in full_data],
         }
         json.dump(data, f, indent=4)
-    logging.info("Saved collected data to full_data.json")
+    # the analysis scripts load this columnar copy instead of parsing the json
+    save_sketch_columns(full_data)
+    logging.info("Saved collected data to full_data.json and %s", FULL_DATA_COLUMNS_PATH)
+
+
+async def _scrape_scenes(incremental: bool, recheck_seasons: int = 0) -> list:
+    """Scrapes the archive and saves both the per episode and the flat scene data.
+    If incremental, only episodes that aren't stored or belong to the last `recheck_seasons` seasons are fetched"""
+    episodes = load_episode_data() if incremental else {}
+    async with aiohttp.ClientSession() as session:
+        # an update is only useful if it sees the episodes added since the list page was cached
+        urls = await get_all_episode_urls(session, fresh=incremental)
+        seasons = sorted(set(get_episode_season(url) for url in urls))
+        recent_seasons = seasons[-recheck_seasons:] if recheck_seasons > 0 else []
+        urls_to_fetch = [
+            url for url in urls
+            if url not in episodes or get_episode_season(url) in recent_seasons
+        ]
+        print(f"found {len(urls)} episodes, fetching {len(urls_to_fetch)}")
+        pbar = tqdm(total=len(urls_to_fetch), desc="Collecting scene data")
 
+        def on_complete(_):
+            pbar.update(1)
 
-async def update_video_sentiment_stats(sketches: List[Sketch]):
-    """Adds the comment sentiment fields to the video data. It modifies the passed list, so there are no return values"""
-    # filter out sketches that already have their sentiment stats calculated
-    sketches = [
-        sketch
-        for sketch in sketches
-        if sketch.mean_sentiment is None or sketch.std_sentiment is None
-    ]
-    async with aiohttp.ClientSession(timeout=15) as session:
         semaphore = asyncio.Semaphore(15)
+        # pages are parsed in worker processes so parsing never stalls the downloads
         with ProcessPoolExecutor(multiprocessing.cpu_count()) as executor:
             tasks = [
                 asyncio.create_task(
-                    fetch_and_analyze_comments(video, session, semaphore, executor)
+                    get_episode_from_url(url, session, semaphore, episodes.get(url), executor)
+                )
+                for url in urls_to_fetch
+            ]
+
+            for task in tasks:
+                task.add_done_callback(on_complete)
+
+            fetched_episodes = await asyncio.gather(*tasks)
+
+    for url, episode in zip(urls_to_fetch, fetched_episodes):
+        if episode is not None:
+            episodes[url] = episode
+    with open("data/episodes.json", "w", encoding="utf-8") as f:
+        data = {
+            "last_updated": datetime.datetime.now().isoformat(),
+            "episodes": episodes,
+        }
+        json.dump(data, f, indent=4)
+
+    # keep the archive's episode order in the flat scene list
+    scenes = [scene for url in urls if url in episodes for scene in episodes[url]["scenes"]]
+    with open("data/scenes.json", "w", encoding="utf-8") as f:
+        data = {
+            "last_updated": datetime.datetime.now().isoformat(),
+            "scene_data": scenes,
+        }
+        json.dump(data, f, indent=4)
+    save_scene_columns(scenes)
+    logging.info("Saved scene data to file")
+    return scenes
+
+
+async def update_video_sentiment_stats(
+    sketches: List[Sketch],
+    refresh: bool = False,
+    sampling: SamplingPolicy = None,
+    deduplicate: bool = False,
+    max_copies: int = None,
+):
+    """Adds the comment sentiment fields to the video data. It modifies the passed list, so there are no return values.
+    If refresh, every sketch is updated with only the comments posted since its last analysis.
+    A sampling policy can stop each video's analysis before all of its comments are scored.
+    If deduplicate, exact duplicate comments of a video are scored once and share the score, and
+    with max_copies set, exact or near copies of a comment past that many are left out as spam"""
+    if not refresh:
+        # filter out sketches that already have their sentiment stats calculated
+        sketches = [
+            sketch
+            for sketch in sketches
+            if sketch.mean_sentiment is None or sketch.std_sentiment is None
+        ]
+    store = CommentScoreStore()
+    # fetched pages wait here for a scorer. When it's full, fetching pauses until scoring catches up
+    page_queue = asyncio.Queue(maxsize=COMMENT_PAGE_QUEUE_SIZE)
+    stats = CommentPipelineStats(page_queue)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=15)) as session:
+        # limits concurrent page requests, not videos, so a few huge videos can't starve the rest
+        semaphore = asyncio.Semaphore(15)
+        num_processes = multiprocessing.cpu_count()
+        with ProcessPoolExecutor(
+            num_processes, initializer=init_sentiment_worker
+        ) as executor:
+            # twice as many scorers as processes so a batch is always queued up for each worker
+            scorers = [
+                asyncio.create_task(_score_comment_pages(page_queue, executor, store, stats))
+                for _ in range(num_processes * 2)
+            ]
+            tasks = [
+                asyncio.create_task(
+                    fetch_and_analyze_comments(
+                        video,
+                        session,
+                        semaphore,
+                        page_queue,
+                        store,
+                        refresh,
+                        sampling,
+                        CommentDeduplicator(max_copies) if deduplicate else None,
+                    )
                 )
                 for video in sketches
             ]
@@ -177,44 +345,152 @@ async def update_video_sentiment_stats(sketches: List[Sketch]):
             )
 
             def on_complete(_):
+                pbar.set_postfix(stats.report(), refresh=False)
                 pbar.update(1)
 
             for task in tasks:
                 task.add_done_callback(on_complete)
 
             await asyncio.gather(*tasks)
-    
+            for scorer in scorers:
+                scorer.cancel()
+    store.close()
+    logging.info("Comment pipeline finished: %s", stats.report())
+
+
+class CommentPipelineStats:
+    """Throughput and queue depth of the comment fetching and scoring pipeline"""
+
+    def __init__(self, page_queue: asyncio.Queue):
+        self.page_queue = page_queue
+        self.pages_scored = 0
+        self.comments_scored = 0
+        self.texts_scored = 0
+        self.max_queue_depth = 0
+        self._start = time.monotonic()
+
+    def record_page(self, num_comments: int, num_texts_scored: int = None):
+        """num_texts_scored is how many distinct texts actually went through the scorer, if duplicates were skipped"""
+        self.pages_scored += 1
+        self.comments_scored += num_comments
+        self.texts_scored += num_comments if num_texts_scored is None else num_texts_scored
+        self.max_queue_depth = max(self.max_queue_depth, self.page_queue.qsize())
+
+    def report(self) -> dict:
+        elapsed = time.monotonic() - self._start
+        return {
+            "comments/s": round(self.comments_scored / elapsed) if elapsed > 0 else 0,
+            "scored": f"{self.texts_scored / self.comments_scored:.0%}" if self.comments_scored else "-",
+            "pages": self.pages_scored,
+            "queue": self.page_queue.qsize(),
+            "max queue": self.max_queue_depth,
+        }
 
 
 async def fetch_and_analyze_comments(
     sketch: Sketch,
-    session: aiohttp.ClientSession(),
+    session: aiohttp.ClientSession,
     semaphore: asyncio.Semaphore,
-    executor: ProcessPoolExecutor,
+    page_queue: asyncio.Queue,
+    store: CommentScoreStore,
+    refresh: bool = False,
+    sampling: SamplingPolicy = None,
+    dedup: CommentDeduplicator = None,
 ):
-    sentiment_analysis_tasks = []
-    async for comment_chunk in fetch_video_comments(sketch.id, session, semaphore):
-        tasks = [
-            asyncio.create_task(multi_core_sentiment_analysis(comment, executor))
-            for comment in comment_chunk
-        ]
-        sentiment_analysis_tasks.extend(tasks)
-
-    sentiment_results = np.array(await asyncio.gather(*sentiment_analysis_tasks))
-    sketch.mean_sentiment = sentiment_results.mean()
-    sketch.std_sentiment = sentiment_results.std()
+    # each page of comments is queued for scoring and folded into the running stats as soon as it's done
+    aggregator = SentimentAggregator()
+    scored_pages = []
+    num_fetched = 0
+    async with contextlib.aclosing(
+        # a refresh is looking for comments posted since the pages were cached
+        fetch_video_comment_threads(sketch.id, session, semaphore, fresh=refresh)
+    ) as pages:
+        async for comments in pages:
+            if refresh:
+                # comments come newest first, so everything after the first stored one was already scored
+                new_comments = list(
+                    itertools.takewhile(lambda comment: not store.contains(comment["id"]), comments)
+                )
+            else:
+                new_comments = comments
+            if sampling is not None:
+                new_comments = new_comments[: sampling.remaining(num_fetched)]
+            num_fetched += len(new_comments)
+            if new_comments:
+                scored = asyncio.get_running_loop().create_future()
+                await page_queue.put((sketch.id, new_comments, aggregator, dedup, scored))
+                scored_pages.append(scored)
+            if len(new_comments) < len(comments):
+                break
+            if sampling is not None and sampling.target_standard_error is not None and scored_pages:
+                # adaptive sampling needs this page's scores before it can decide whether to fetch another
+                await scored_pages[-1]
+            if sampling is not None and sampling.should_stop(num_fetched, aggregator):
+                break
+    await asyncio.gather(*scored_pages)
+
+    if refresh:
+        count, sketch.mean_sentiment, sketch.std_sentiment = store.get_stats(sketch.id)
+    else:
+        count = aggregator.count
+        sketch.mean_sentiment = aggregator.mean
+        sketch.std_sentiment = aggregator.std
+    sketch.sentiment_comment_count = count
+    sketch.sentiment_ci_width = get_confidence_interval_width(sketch.std_sentiment, count)
     logging.info(
-        "Analyzed comments for %s. Mean: %s, Std: %s from %s comments",
+        "Analyzed comments for %s. Mean: %s, Std: %s from %s comments (%s new)",
         sketch.title,
         sketch.mean_sentiment,
         sketch.std_sentiment,
-        len(sentiment_results),
+        count,
+        aggregator.count,
     )
-
-
-async def multi_core_sentiment_analysis(comment: str, executor: ProcessPoolExecutor):
-    future = executor.submit(score_comment_sentiment, comment)
-    return await asyncio.wrap_future(future)
+    if dedup is not None:
+        logging.info(
+            "%s of %s's comments were exact duplicates of %s distinct comments, %s were exact or near duplicates",
+            dedup.num_duplicates,
+            sketch.title,
+            len(dedup.texts),
+            dedup.num_near_duplicates,
+        )
+
+
+async def _score_comment_pages(
+    page_queue: asyncio.Queue,
+    executor: ProcessPoolExecutor,
+    store: CommentScoreStore,
+    stats: CommentPipelineStats,
+):
+    while True:
+        video_id, comments, aggregator, dedup, scored = await page_queue.get()
+        try:
+            texts = [comment["text"] for comment in comments]
+            if dedup is None:
+                scores = await asyncio.wrap_future(executor.submit(score_comments_batch, texts))
+                num_texts_scored = len(texts)
+            else:
+                band_keys = await asyncio.wrap_future(executor.submit(get_band_keys, texts))
+                text_ids, counted = dedup.assign(texts, band_keys)
+                # only distinct texts that haven't been scored yet are scored
+                unscored = dedup.get_unscored(text_ids)
+                num_texts_scored = len(unscored)
+                if num_texts_scored > 0:
+                    unscored_texts = [dedup.texts[text_id] for text_id in unscored]
+                    dedup.set_scores(
+                        unscored,
+                        await asyncio.wrap_future(executor.submit(score_comments_batch, unscored_texts)),
+                    )
+                # every comment counts with its text's score, so duplicates still weigh in by multiplicity
+                comments = [comment for comment, is_counted in zip(comments, counted) if is_counted]
+                scores = dedup.get_scores(text_ids[counted])
+            aggregator.add(scores)
+            store.add_scores(video_id, comments, scores)
+            stats.record_page(len(texts), num_texts_scored)
+            scored.set_result(None)
+        except Exception as exc:
+            scored.set_exception(exc)
+        finally:
+            page_queue.task_done()
 
 
 def _fetch_identification_for_all_videos(username: str) -> list:
@@ -224,6 +500,15 @@ def _fetch_identification_for_all_videos(username: str) -> list:
     return channel_videos
 
 
+def _save_channel_videos(channel_videos: list):
+    with open("data/channel_videos.json", "w", encoding="utf-8") as f:
+        data = {
+            "last_updated": datetime.datetime.now().isoformat(),
+            "channel_videos": channel_videos,
+        }
+        json.dump(data, f, indent=4)
+
+
 def _filter_videos(channel_videos: list) -> list:
     blocked_strings = ["behind the sketch", "behind the scenes", "bloopers", "(live)"] # Use this to manually filter titles
     required_strings = ["- SNL", "- Saturday Night Live"]
@@ -244,68 +529,167 @@ def _filter_videos(channel_videos: list) -> list:
     return filtered_videos
 
 
-def _combine_archive_with_filtered_videos(scenes: dict, filtered_videos: list) -> dict:
+def _combine_archive_with_filtered_videos(scene_columns: dict, filtered_videos: list) -> dict:
     composite_data = []
-    scene_titles = [
-        scene["title"] for scene in scenes if scene["title"] is not None
-    ]
-    # load function args into list of tuples for multiprocessing
-    args = [
-        (vid, scene_titles, scenes)
+    videos = [
+        {"id": vid["id"], "title": vid["title"], "upload_date": vid.get("upload_date")}
         for vid in filtered_videos
         if vid["title"] is not None
     ]
+
+    # only match videos that weren't already matched against this exact archive by this exact matcher
+    fingerprint = _get_match_fingerprint(scene_columns)
+    match_cache = _load_match_cache(fingerprint)
+    unmatched_videos = []
+    for video in videos:
+        key = _get_match_cache_key(video)
+        if key in match_cache:
+            if match_cache[key] is not None:
+                composite_data.append({"id": video["id"], **match_cache[key]})
+        else:
+            unmatched_videos.append(video)
+    logging.info("%s of %s videos found in match cache", len(videos) - len(unmatched_videos), len(videos))
+    if not unmatched_videos:
+        return composite_data
+
+    # index the scene titles once so each video is only scored against a few candidates
+    matcher = TitleMatcher(
+        decode_column(scene_columns, "title", SCENE_COLUMN_KINDS["title"]),
+        decode_column(scene_columns, "air_date", SCENE_COLUMN_KINDS["air_date"]),
+        n=MATCH_NGRAM_SIZE,
+        max_candidates=MATCH_MAX_CANDIDATES,
+        window_days=MATCH_WINDOW_DAYS,
+    )
+    # scenes are only decoded for titles that actually get matched
+    scene_index = SceneIndex.from_columns(scene_columns, tie_break=MATCH_TIE_BREAK, window_days=MATCH_WINDOW_DAYS)
     num_processes = multiprocessing.cpu_count()
+    # workers receive the index once on startup, so tasks only carry a chunk of video titles
+    chunk_size = max(1, len(unmatched_videos) // (num_processes * 4))
+    chunks = [
+        unmatched_videos[i:i + chunk_size]
+        for i in range(0, len(unmatched_videos), chunk_size)
+    ]
     print(f"Utilizing {num_processes} CPU cores for title matching")
-    with multiprocessing.Pool(processes=num_processes) as pool:
-        for result in sync_tqdm(
-            pool.imap_unordered(_multi_core_wrapper, args),
-            total=len(args),
-            desc="Indexing video titles",
-        ):
-            if result is not None:
-                composite_data.append(result)
-
+    with multiprocessing.Pool(
+        processes=num_processes,
+        initializer=_init_matching_worker,
+        initargs=(matcher, scene_index),
+    ) as pool:
+        with sync_tqdm(total=len(unmatched_videos), desc="Indexing video titles") as pbar:
+            for results in pool.imap_unordered(_match_video_chunk, chunks):
+                pbar.update(len(results))
+                for video, result in results:
+                    key = _get_match_cache_key(video)
+                    if result is None:
+                        match_cache[key] = None
+                        continue
+                    match_cache[key] = {k: v for k, v in result.items() if k != "id"}
+                    composite_data.append(result)
+
+    _save_match_cache(fingerprint, match_cache)
     return composite_data
 
 
-def _multi_core_wrapper(args: tuple):
-    return _get_combined_data_from_video_info(*args)
+def _get_match_fingerprint(scene_columns: dict) -> str:
+    """Identifies the archive and the matcher settings, which together decide every match"""
+    digest = hashlib.sha256()
+    settings = {
+        "version": MATCHER_VERSION,
+        "threshold": MATCH_THRESHOLD,
+        "ngram_size": MATCH_NGRAM_SIZE,
+        "max_candidates": MATCH_MAX_CANDIDATES,
+        "window_days": MATCH_WINDOW_DAYS,
+        "tie_break": MATCH_TIE_BREAK.__name__,
+    }
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    for name in sorted(scene_columns):
+        digest.update(name.encode("utf-8"))
+        digest.update(np.ascontiguousarray(scene_columns[name]).tobytes())
+    return digest.hexdigest()
+
+
+def _get_match_cache_key(video: dict) -> str:
+    # matches are blocked by upload date, so the same title uploaded on another day may match another scene
+    key = " ".join(video["title"].lower().split())
+    if video.get("upload_date") is not None:
+        key += "|" + video["upload_date"][:10]
+    return key
+
+
+def _load_match_cache(fingerprint: str) -> dict:
+    """Returns the stored matches (normalized video title -> scene, or None if it had no match) if they were made against the same archive
+    with the same matcher"""
+    try:
+        with open(MATCH_CACHE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    # caches from before the matcher settings were fingerprinted only have an archive_fingerprint, and are discarded too
+    if data.get("match_fingerprint") != fingerprint:
+        logging.info("Scene archive or matcher changed since last match, discarding match cache")
+        return {}
+    return data["matches"]
+
+
+def _save_match_cache(fingerprint: str, matches: dict):
+    with open(MATCH_CACHE_PATH, "w", encoding="utf-8") as f:
+        data = {
+            "last_updated": datetime.datetime.now().isoformat(),
+            "match_fingerprint": fingerprint,
+            "matches": matches,
+        }
+        json.dump(data, f, indent=4)
+
+
+_worker_matcher = None
+_worker_scene_index = None
+
+
+def _init_matching_worker(matcher: TitleMatcher, scene_index: SceneIndex):
+    global _worker_matcher, _worker_scene_index
+    _worker_matcher = matcher
+    _worker_scene_index = scene_index
+
+
+def _match_video_chunk(videos: list) -> list:
+    matching_titles = _worker_matcher.match_many(
+        [video["title"] for video in videos],
+        MATCH_THRESHOLD,
+        [video["upload_date"] for video in videos],
+    )
+    return [
+        (video, _get_combined_data_from_video_info(video, matching_title, _worker_scene_index))
+        for video, matching_title in zip(videos, matching_titles)
+    ]
 
 
 def _get_combined_data_from_video_info(
-    video_info: dict, scene_titles, scene_data: list
+    video_info: dict, matching_scene_title: str, scene_index: SceneIndex
 ) -> dict:
-    matching_scene_title = get_matching_string(video_info["title"], scene_titles, 0.8)
     if matching_scene_title is not None:
         logging.info('matched video: "%s" with scene "%s"', video_info['title'], matching_scene_title)
         # print(f'matched video: "{video_info['title']}" with scene "{matching_scene_title}"')
-        matching_scene = _get_scene_by_title(matching_scene_title, scene_data)
+        matching_scene = scene_index.get_scene(matching_scene_title, video_info)
         matched_video = {"id": video_info["id"], **matching_scene}
         return matched_video
 
 
-def _get_scene_by_title(title: str, scenes: list) -> dict:
-    for scene in scenes:
-        if scene["title"] == title:
-            return scene
-
-
-def _fetch_youtube_stats(sketch_data: List[Sketch]) -> list:
-    id_list = _get_ids(sketch_data)
-    video_stats = fetch_video_statistics(id_list)
-    return video_stats  # TODO: might want to return updated sketch_data instead?
-
-
-def _get_ids(sketch_data: List[Sketch]) -> list:
-    ids = [sketch.id for sketch in sketch_data]
-    return ids
-
-
-def _fetch_youtube_stats(sketch_data: List[Sketch]) -> list:
-    id_list = _get_ids(sketch_data)
-    video_stats = fetch_video_statistics(id_list)
-    return video_stats  # TODO: might want to return updated sketch_data instead?
+async def _fetch_youtube_stats(sketch_data: List[Sketch]):
+    """Adds the youtube statistics to the video data as they arrive. It modifies the passed list, so there are no return values"""
+    sketches_by_id = {sketch.id: sketch for sketch in sketch_data}
+    pbar = sync_tqdm(total=len(sketches_by_id), desc="Fetching video statistics")
+    async with aiohttp.ClientSession() as session:
+        async with contextlib.aclosing(fetch_video_statistics_async(_get_ids(sketch_data), session)) as batches:
+            async for video_stats in batches:
+                for video in video_stats:
+                    sketch = sketches_by_id[video['video_id']]
+                    sketch.view_count = video['view_count']
+                    sketch.like_count = video['like_count']
+                    sketch.comment_count = video['comment_count']
+                    sketch.duration = video['duration']
+                    sketch.upload_date = video['upload_date']
+                pbar.update(len(video_stats))
+    pbar.close()
 
 
 def _get_ids(sketch_data: List[Sketch]) -> list:
@@ -317,6 +701,8 @@ def clear_sentiment():
     for sketch in full_data:
         sketch.mean_sentiment = None
         sketch.std_sentiment = None
+        sketch.sentiment_comment_count = None
+        sketch.sentiment_ci_width = None
     with open("data/full_data.json", "w", encoding="utf-8") as f:
         data = {
             "last_updated": datetime.datetime.now().isoformat(),
@@ -0,0 +1,50 @@
+import math
+import sqlite3
+
+
+class CommentScoreStore:
+    """Sentiment scores of every comment analyzed so far, keyed by youtube comment id"""
+
+    def __init__(self, path: str = "data/comment_scores.sqlite"):
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS comment_scores (
+                id TEXT PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                score REAL NOT NULL,
+                published_at TEXT
+            )"""
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS comment_scores_video ON comment_scores (video_id)"
+        )
+
+    def contains(self, comment_id: str) -> bool:
+        row = self._connection.execute(
+            "SELECT 1 FROM comment_scores WHERE id = ?", (comment_id,)
+        ).fetchone()
+        return row is not None
+
+    def add_scores(self, video_id: str, comments: list, scores):
+        """Stores the scores of a page of comments (dicts with an id and published_at, as yielded by fetch_video_comment_threads)"""
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO comment_scores VALUES (?, ?, ?, ?)",
+            [
+                (comment["id"], video_id, float(score), comment["published_at"])
+                for comment, score in zip(comments, scores)
+            ],
+        )
+        self._connection.commit()
+
+    def get_stats(self, video_id: str) -> tuple:
+        """Returns the count, mean and (population) standard deviation of the stored scores for a video"""
+        count, mean, mean_of_squares = self._connection.execute(
+            "SELECT COUNT(*), AVG(score), AVG(score * score) FROM comment_scores WHERE video_id = ?",
+            (video_id,),
+        ).fetchone()
+        if count == 0:
+            return 0, float("nan"), float("nan")
+        return count, mean, math.sqrt(max(mean_of_squares - mean**2, 0.0))
+
+    def close(self):
+        self._connection.close()
@@ -1,4 +1,8 @@
+from typing import List, Optional
+import numpy as np
+from scipy import sparse
 from fuzzywuzzy import process, fuzz
+from rapidfuzz import process as rf_process, fuzz as rf_fuzz, utils as rf_utils
 
 
 def get_matching_string(string: str, strings: list, threshold: float = 0.8) -> str:
@@ -7,6 +11,131 @@ def get_matching_string(string: str, strings: list, threshold: float = 0.8) -> s
         return result[0]
 
 
+class TitleMatcher:
+    """Two stage fuzzy matcher over a fixed list of titles.
+
+    The titles are indexed once by their word trigrams. Each query first collects a short list of
+    candidate titles sharing the most trigrams with it, then the candidates are re-ranked with
+    rapidfuzz's token_sort_ratio, so the result is the same best-match-above-threshold that
+    get_matching_string returns without scoring every title for every query.
+
+    If the titles come with dates (e.g. the air date of each scene), queries with a date are
+    blocked to titles dated within `window_days` before it, falling back to every title when
+    nothing in the window matches.
+    """
+
+    def __init__(self, titles: list, dates: list = None, n: int = 3, max_candidates: int = 50, window_days: int = 14):
+        self.n = n
+        self.max_candidates = max_candidates
+        self.window_days = window_days
+        if dates is None:
+            dates = [None] * len(titles)
+        # duplicate entries only need to be scored once. dict keeps the first-seen order for ties
+        entries = list(dict.fromkeys(
+            (title, date) for title, date in zip(titles, dates) if title is not None
+        ))
+        self.titles = [title for title, _ in entries]
+        self._dates = np.array([_to_day(date) for _, date in entries], dtype="datetime64[D]")
+        self._processed = [_process_title(title) for title in self.titles]
+        self._lengths = np.array([len(title) for title in self._processed])
+        self._vocabulary = {}
+        self._index = self._vectorize(self._processed, grow=True).T.tocsr()
+
+    def match(self, string: str, threshold: float = 0.8, date: str = None) -> Optional[str]:
+        return self.match_many([string], threshold, [date])[0]
+
+    def match_many(self, strings: list, threshold: float = 0.8, dates: list = None) -> List[Optional[str]]:
+        # fuzzywuzzy rounds its scores to integers, so anything that rounds up to the cutoff passes
+        score_cutoff = threshold * 100 - 0.5
+        if dates is None:
+            dates = [None] * len(strings)
+        processed = [_process_title(string) for string in strings]
+        # number of trigrams each query shares with every indexed title
+        shared = (self._vectorize(processed) @ self._index).tocsr()
+        matches = []
+        for i, (query, date) in enumerate(zip(processed, dates)):
+            day = _to_day(date)
+            match = None
+            if not np.isnat(day):
+                candidates = self._get_candidates(shared, i, len(query), score_cutoff, day)
+                match = self._get_best_match(query, candidates, score_cutoff)
+            if match is None:
+                # undated queries and archival uploads are matched against every title
+                candidates = self._get_candidates(shared, i, len(query), score_cutoff)
+                match = self._get_best_match(query, candidates, score_cutoff)
+            matches.append(match)
+        return matches
+
+    def _get_best_match(self, query: str, candidates: np.ndarray, score_cutoff: float) -> Optional[str]:
+        if len(candidates) == 0:
+            return None
+        scores = rf_process.cdist(
+            [query],
+            [self._processed[c] for c in candidates],
+            scorer=rf_fuzz.token_sort_ratio,
+            score_cutoff=score_cutoff,
+        )[0]
+        scores = np.rint(scores)
+        best = int(np.argmax(scores))  # argmax keeps the first title on ties, like extractOne
+        return self.titles[candidates[best]] if scores[best] > 0 else None
+
+    def _get_candidates(self, shared, row: int, length: int, score_cutoff: float, day=None) -> np.ndarray:
+        start, end = shared.indptr[row], shared.indptr[row + 1]
+        candidates = shared.indices[start:end]
+        counts = shared.data[start:end]
+        # the indel similarity 2 * matches / (len1 + len2) can't reach the cutoff once the shorter
+        # string is too small a fraction of the longer one
+        lengths = self._lengths[candidates]
+        shorter = np.minimum(lengths, length)
+        keep = 200 * shorter >= score_cutoff * (lengths + length)
+        if day is not None:
+            # a video can go up the day after airing (in UTC), but no later than the window allows
+            dates = self._dates[candidates]
+            in_window = (dates <= day + 1) & (dates >= day - self.window_days)
+            keep &= in_window | np.isnat(dates)
+        candidates, counts = candidates[keep], counts[keep]
+        if len(candidates) > self.max_candidates:
+            # keep everything tied with the last candidate so the list doesn't depend on index order
+            min_count = np.partition(counts, -self.max_candidates)[-self.max_candidates]
+            candidates = candidates[counts >= min_count]
+        return np.sort(candidates)
+
+    def _vectorize(self, processed: list, grow: bool = False) -> sparse.csr_matrix:
+        rows, cols = [], []
+        for i, title in enumerate(processed):
+            for gram in _get_ngrams(title, self.n):
+                col = self._vocabulary.get(gram)
+                if col is None:
+                    if not grow:
+                        continue
+                    col = self._vocabulary[gram] = len(self._vocabulary)
+                rows.append(i)
+                cols.append(col)
+        return sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+            shape=(len(processed), len(self._vocabulary)),
+        )
+
+
+def _process_title(title: str) -> str:
+    # same normalization fuzzywuzzy applies before token_sort_ratio
+    return " ".join(sorted(rf_utils.default_process(title).split()))
+
+
+def _to_day(date: Optional[str]) -> np.datetime64:
+    # accepts both archive air dates (2020-03-07) and youtube timestamps (2020-03-08T05:10:00Z)
+    if date is None:
+        return np.datetime64("NaT", "D")
+    return np.datetime64(date[:10], "D")
+
+
+def _get_ngrams(title: str, n: int) -> set:
+    grams = set()
+    for token in title.split():
+        padded = f" {token} "
+        grams.update(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+    return grams
+
 
 if __name__ == "__main__":
     print(
@@ -0,0 +1,183 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import aiohttp
+import requests
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# how long responses stay fresh, by url prefix. The longest matching prefix wins
+DEFAULT_TTLS = {
+    "https://www.googleapis.com/youtube/v3/channels": 30 * DAY,
+    # the newest uploads page has to stay fresh for --sync-videos to see new videos
+    "https://www.googleapis.com/youtube/v3/playlistItems": HOUR,
+    "https://www.googleapis.com/youtube/v3/videos": DAY,
+    # new comments land on the first pages, so these can't stay fresh for long either
+    "https://www.googleapis.com/youtube/v3/commentThreads": HOUR,
+    # the episode list page gains an episode every week of the season, while the episode pages rarely change
+    "http://www.snlarchives.net/Episodes/": HOUR,
+    "http://www.snlarchives.net/Episodes/?": 7 * DAY,
+}
+DEFAULT_TTL = DAY
+
+# params that don't change the response and shouldn't end up in cache keys
+IGNORED_PARAMS = {"key"}
+
+
+class OfflineCacheMiss(KeyError):
+    """Raised in offline mode when a request has no stored response"""
+
+
+class ResponseCache:
+    """Stores gzipped response bodies on disk, keyed by a hash of the normalized url and params.
+
+    Entries expire after the ttl of their endpoint, and the least recently used entries are evicted
+    once the directory grows past max_bytes. In offline mode every stored entry is served regardless
+    of age and anything else raises OfflineCacheMiss instead of touching the network.
+    """
+
+    def __init__(self, directory: str = "data/http_cache", max_bytes: int = 500 * 1024 * 1024, ttls: dict = None, offline: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.offline = offline
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory))
+
+    def get(self, url: str, params: dict = None) -> Optional[bytes]:
+        key, normalized_url = self._get_key(url, params)
+        path = os.path.join(self.directory, key + ".gz")
+        try:
+            with gzip.open(path, "rb") as f:
+                metadata = json.loads(f.readline())
+                body = f.read()
+        except FileNotFoundError:
+            if self.offline:
+                raise OfflineCacheMiss(f"no stored response for {normalized_url}") from None
+            return None
+        except (EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+            # left half written by a run that died before entries were written atomically
+            logging.warning("discarding corrupt http cache entry for %s", normalized_url)
+            self._remove(path)
+            if self.offline:
+                raise OfflineCacheMiss(f"stored response for {normalized_url} is corrupt") from None
+            return None
+        if not self.offline and time.time() - metadata["stored_at"] > self._get_ttl(normalized_url):
+            return None
+        os.utime(path)  # mark as recently used
+        return body
+
+    def set(self, url: str, params: dict, body: bytes):
+        key, normalized_url = self._get_key(url, params)
+        path = os.path.join(self.directory, key + ".gz")
+        metadata = json.dumps({"url": normalized_url, "stored_at": time.time()})
+        if os.path.exists(path):
+            self._size -= os.path.getsize(path)
+        # written next to the entry and moved into place, so a crash never leaves a truncated entry behind
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                f.write(metadata.encode("utf-8") + b"\n" + body)
+            os.replace(temp_path, path)
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        if not path.endswith(".tmp"):
+            self._size -= size
+
+    def _evict(self):
+        entries = sorted(os.scandir(self.directory), key=lambda entry: entry.stat().st_mtime)
+        # evict a little past the cap so we don't rescan the directory on every write
+        target = self.max_bytes * 0.9
+        for entry in entries:
+            if self._size <= target:
+                break
+            self._size -= entry.stat().st_size
+            os.remove(entry.path)
+        logging.info("evicted http cache entries down to %s bytes", self._size)
+
+    def _get_ttl(self, normalized_url: str) -> float:
+        prefixes = [prefix for prefix in self.ttls if normalized_url.startswith(prefix)]
+        if not prefixes:
+            return DEFAULT_TTL
+        return self.ttls[max(prefixes, key=len)]
+
+    def _get_key(self, url: str, params: dict = None) -> tuple:
+        normalized_url = _normalize_url(url, params)
+        return hashlib.sha256(normalized_url.encode("utf-8")).hexdigest(), normalized_url
+
+
+def _normalize_url(url: str, params: dict = None) -> str:
+    scheme, netloc, path, query, _ = urlsplit(url)
+    query_params = parse_qsl(query, keep_blank_values=True)
+    for name, value in (params or {}).items():
+        values = value if isinstance(value, list) else [value]
+        query_params.extend((name, str(v)) for v in values)
+    query_params = sorted(
+        (name, value) for name, value in query_params if name not in IGNORED_PARAMS
+    )
+    # some urls (like archive episodes) use a bare query string as their id
+    return urlunsplit((scheme.lower(), netloc.lower(), path, urlencode(query_params).rstrip("="), ""))
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def enable_cache(**kwargs):
+    """Turns on response caching for every request made through this module"""
+    global _cache
+    _cache = ResponseCache(**kwargs)
+
+
+def get_cache() -> Optional[ResponseCache]:
+    return _cache
+
+
+def get_json(url: str, params: dict = None, timeout: int = 15, fresh: bool = False) -> dict:
+    """If fresh, a stored response is only used in offline mode. The new response is stored either way"""
+    if _cache is not None and (not fresh or _cache.offline):
+        body = _cache.get(url, params)
+        if body is not None:
+            return json.loads(body)
+    response = requests.get(url, params=params, timeout=timeout)
+    if _cache is not None and response.ok:
+        _cache.set(url, params, response.content)
+    return response.json()
+
+
+async def get_json_async(session: aiohttp.ClientSession, url: str, params: dict = None, timeout: int = 15, fresh: bool = False) -> dict:
+    return json.loads(await get_body_async(session, url, params, timeout, fresh))
+
+
+async def get_text_async(session: aiohttp.ClientSession, url: str, params: dict = None, timeout: int = 15, fresh: bool = False) -> str:
+    return (await get_body_async(session, url, params, timeout, fresh)).decode("utf-8")
+
+
+async def get_body_async(session: aiohttp.ClientSession, url: str, params: dict = None, timeout: int = 15, fresh: bool = False) -> bytes:
+    """If fresh, a stored response is only used in offline mode. The new response is stored either way"""
+    if _cache is not None and (not fresh or _cache.offline):
+        body = _cache.get(url, params)
+        if body is not None:
+            return body
+    async with session.get(url, params=params, timeout=timeout) as res:
+        body = await res.read()
+        if _cache is not None and res.status == 200:
+            _cache.set(url, params, body)
+    return body
@@ -0,0 +1,101 @@
+import datetime
+import numpy as np
+from typing import Callable, Dict, Iterable, List, Optional
+from analysis.columnar import SCENE_COLUMN_KINDS, get_rows
+
+# A tie-break policy picks one scene out of every scene sharing the matched title
+TieBreak = Callable[[List[dict], dict], dict]
+
+# reruns list the scenes they repeat under this type, without the original's cast or date
+ENCORE_SCENE_TYPE = "Encore Presentation"
+
+
+def pick_first_scene(candidates: List[dict], video_info: dict) -> dict:
+    return candidates[0]
+
+
+def pick_most_recent_scene(candidates: List[dict], video_info: dict) -> dict:
+    # the archive is scraped oldest episode first, so later scenes are more recent when air dates are missing
+    return max(reversed(candidates), key=lambda scene: scene.get("air_date") or "")
+
+
+def pick_scene_by_cast_overlap(candidates: List[dict], video_info: dict) -> dict:
+    """Picks the scene whose cast is mentioned most in the video title, preferring the most recent on ties"""
+    title = video_info["title"].lower()
+    overlaps = [
+        sum(1 for actor in scene["cast"] if actor and actor.lower() in title)
+        for scene in candidates
+    ]
+    best = max(overlaps)
+    # walk backwards so the most recent scene wins ties
+    for scene, overlap in zip(reversed(candidates), reversed(overlaps)):
+        if overlap == best:
+            return scene
+
+
+class SceneIndex:
+    """Maps each scene title to every scene in the archive with that title"""
+
+    def __init__(self, scenes: Iterable[dict], tie_break: TieBreak = pick_scene_by_cast_overlap, window_days: int = 14):
+        self.tie_break = tie_break
+        self.window_days = window_days
+        self._scenes_by_title: Dict[str, List[dict]] = {}
+        # only set for indexes built from columns, whose scenes are decoded the first time they're asked for
+        self._columns = None
+        self._row_order = None
+        self._row_ranges_by_title: Dict[str, tuple] = {}
+        for scene in scenes:
+            if scene["title"] is not None:
+                self._scenes_by_title.setdefault(scene["title"], []).append(scene)
+
+    @classmethod
+    def from_columns(cls, columns: dict, tie_break: TieBreak = pick_scene_by_cast_overlap, window_days: int = 14) -> "SceneIndex":
+        """Builds the index from scene columns (see analysis/columnar.py) without decoding any scene.
+        Only each title's range of rows is kept, which also keeps the index small to pickle"""
+        index = cls([], tie_break, window_days)
+        # fixed width strings pad every value to the longest one, which adds up when the index is pickled
+        index._columns = {
+            name: column.astype(object) if name.endswith(".categories") else column
+            for name, column in columns.items()
+        }
+        title_codes = np.asarray(columns["title"])
+        # a stable sort keeps each title's scenes in archive order
+        index._row_order = np.argsort(title_codes, kind="stable")
+        sorted_codes = title_codes[index._row_order]
+        codes, starts, counts = np.unique(sorted_codes, return_index=True, return_counts=True)
+        titles = columns["title.categories"].tolist()
+        index._row_ranges_by_title = {
+            titles[code]: (start, start + count)
+            for code, start, count in zip(codes.tolist(), starts.tolist(), counts.tolist())
+            if code >= 0
+        }
+        return index
+
+    def get_scenes(self, title: str) -> List[dict]:
+        if title not in self._scenes_by_title and title in self._row_ranges_by_title:
+            start, end = self._row_ranges_by_title[title]
+            self._scenes_by_title[title] = get_rows(self._columns, SCENE_COLUMN_KINDS, self._row_order[start:end])
+        return self._scenes_by_title.get(title, [])
+
+    def get_scene(self, title: str, video_info: dict) -> Optional[dict]:
+        candidates = self.get_scenes(title)
+        if not candidates:
+            return None
+        # a rerun's record of a scene is never the one the video is of when the original is in the archive
+        originals = [scene for scene in candidates if scene.get("scene_type") != ENCORE_SCENE_TYPE]
+        if originals:
+            candidates = originals
+        # prefer scenes that aired shortly before the video was uploaded
+        in_window = [scene for scene in candidates if self._aired_in_window(scene, video_info)]
+        if in_window:
+            candidates = in_window
+        if len(candidates) == 1:
+            return candidates[0]
+        return self.tie_break(candidates, video_info)
+
+    def _aired_in_window(self, scene: dict, video_info: dict) -> bool:
+        if scene.get("air_date") is None or video_info.get("upload_date") is None:
+            return False
+        air_date = datetime.date.fromisoformat(scene["air_date"])
+        upload_date = datetime.date.fromisoformat(video_info["upload_date"][:10])
+        return -1 <= (upload_date - air_date).days <= self.window_days
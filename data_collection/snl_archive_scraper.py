@@ -1,17 +1,20 @@
 import asyncio
+import datetime
 import re
-import requests
 import aiohttp
 import bs4
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import Executor
 from schema import Scene
+from data_collection import http_cache
 from typing import List
 
-async def get_all_episode_urls(session: aiohttp.ClientSession):
+HTML_PARSER = 'lxml'
+
+async def get_all_episode_urls(session: aiohttp.ClientSession, fresh: bool = False):
 
     BASE_URL = "http://www.snlarchives.net/Episodes/"
-    async with session.get(BASE_URL) as res:
-        soup = BeautifulSoup(await res.text(), 'html.parser')
+    soup = BeautifulSoup(await http_cache.get_text_async(session, BASE_URL, fresh=fresh), 'html.parser')
     chunks = soup.find_all(name='table', class_='sketch-roles')
     urls = []
     for chunk in chunks:
@@ -21,26 +24,98 @@ async def get_all_episode_urls(session: aiohttp.ClientSession):
             urls.append(BASE_URL + tag.td.a['href'])
     return urls
 
-async def get_scenes_from_episode_url(url: str, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore) -> List[Scene]:
+async def get_scenes_from_episode_url(url: str, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, executor: Executor = None) -> List[Scene]:
     try:
         async with semaphore:
-            async with session.get(url) as res:
-                soup = BeautifulSoup(await res.text(), 'html.parser')
-
-            # card is div with classes 'card' and 'card-sketch...' has class card
-            class_regex = re.compile('card-sketch.*')
-            # inside div id full
-            cards = soup.find(id='full').find_all(class_=class_regex)
-            # print("done")
-            return [Scene(
-                title=get_scene_title(card),
-                scene_type=get_scene_type(card),
-                cast=get_scene_actors(card)
-            ) for card in cards]
+            html = await http_cache.get_text_async(session, url)
+        # parse outside the semaphore and off the event loop so other downloads keep going
+        return await asyncio.get_running_loop().run_in_executor(executor, parse_episode_scenes, html, url)
     except TimeoutError:
         print(f"TimeoutError for url: {url}")
 
 
+async def get_episode_from_url(url: str, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, cached_episode: dict = None, executor: Executor = None) -> dict:
+    """Fetches an episode's scenes along with the time they were fetched and the page's caching headers.
+    If a previously fetched episode is passed, the request is conditional and its scenes are reused when the page hasn't changed.
+    Pages are parsed in the given executor (a process pool is best), or the loop's default executor if none is given"""
+    fetched_at = datetime.datetime.now().isoformat()
+    # a response stored in the http cache (if enabled) skips the request entirely
+    cache = http_cache.get_cache()
+    body = cache.get(url) if cache is not None else None
+    if body is not None:
+        etag = cached_episode.get('etag') if cached_episode else None
+        last_modified = cached_episode.get('last_modified') if cached_episode else None
+    else:
+        headers = {}
+        if cached_episode is not None:
+            if cached_episode.get('etag'):
+                headers['If-None-Match'] = cached_episode['etag']
+            if cached_episode.get('last_modified'):
+                headers['If-Modified-Since'] = cached_episode['last_modified']
+        try:
+            async with semaphore:
+                async with session.get(url, headers=headers) as res:
+                    if res.status == 304:
+                        return {**cached_episode, 'fetched_at': fetched_at}
+                    body = await res.read()
+                    etag = res.headers.get('ETag')
+                    last_modified = res.headers.get('Last-Modified')
+                    if cache is not None and res.status == 200:
+                        cache.set(url, None, body)
+        except TimeoutError:
+            print(f"TimeoutError for url: {url}")
+            return None
+    scenes = await asyncio.get_running_loop().run_in_executor(executor, parse_episode_scenes, body.decode('utf-8'), url)
+    return {
+        'fetched_at': fetched_at,
+        'etag': etag,
+        'last_modified': last_modified,
+        'scenes': [dict(scene) for scene in scenes],
+    }
+
+
+def parse_episode_scenes(html: str, url: str) -> List[Scene]:
+    # only the div with id 'full' holds scenes, so skip building the rest of the page
+    soup = BeautifulSoup(html, HTML_PARSER, parse_only=SoupStrainer(id='full'))
+
+    # card is div with classes 'card' and 'card-sketch...' has class card
+    class_regex = re.compile('card-sketch.*')
+    # inside div id full
+    cards = soup.find(id='full').find_all(class_=class_regex)
+    # print("done")
+    # plain strings, since NavigableStrings drag their whole tree along when pickled back from a worker
+    scenes = [Scene(
+        title=get_scene_title(card),
+        scene_type=str(get_scene_type(card)),
+        cast=[str(actor) for actor in get_scene_actors(card)]
+    ) for card in cards]
+    add_episode_info(scenes, url)
+    return scenes
+
+
+def get_episode_season(url: str) -> int:
+    """Returns the year an episode's season started in, based on the air date at the end of its url"""
+    air_date = datetime.datetime.strptime(url.split('?')[-1][:8], '%Y%m%d')
+    # seasons run from the fall until the next spring
+    return air_date.year if air_date.month >= 8 else air_date.year - 1
+
+
+def add_episode_info(scenes: List[Scene], url: str):
+    """Sets the episode id, air date and host on every scene of the episode at the given url"""
+    # episode urls end with the air date, e.g. http://www.snlarchives.net/Episodes/?20200307
+    episode_id = url.split('?')[-1]
+    try:
+        air_date = datetime.datetime.strptime(episode_id, '%Y%m%d').date().isoformat()
+    except ValueError:
+        air_date = None
+    # the host is the one performing the monologue
+    host = next((scene.cast[0] for scene in scenes if scene.scene_type == 'Monologue' and scene.cast), None)
+    for scene in scenes:
+        scene.episode_id = episode_id
+        scene.air_date = air_date
+        scene.host = host
+
+
     
 def get_scene_type(card) -> str:
     return card.find(name='table', class_='sketch-title').tbody.tr.td.a.span.contents[0]
@@ -1,8 +1,9 @@
 import os
-import requests
 import asyncio
+import contextlib
 import aiohttp
 from tqdm import tqdm
+from data_collection import http_cache
 from dotenv import load_dotenv
 import logging
 
@@ -16,10 +17,10 @@ def fetch_video_statistics(video_ids: list) -> list:
     # max number of videos per request is 50, so we need to do it in batches
     video_data = []
     pbar = tqdm(total=len(video_ids), desc="Fetching video statistics")
-    while len(video_ids) > 0:
-        pbar.update(50)
-        video_data.extend(_fetch_videos(video_ids[:50]))
-        video_ids = video_ids[50:]
+    for i in range(0, len(video_ids), 50):
+        batch = video_ids[i:i + 50]
+        video_data.extend(_fetch_videos(batch))
+        pbar.update(len(batch))
     
     pbar.close()
 
@@ -27,46 +28,79 @@ def fetch_video_statistics(video_ids: list) -> list:
     return video_data
 
 
+async def fetch_video_statistics_async(
+    video_ids: list,
+    session: aiohttp.ClientSession,
+    max_concurrency: int = 10,
+):
+    """Fetches statistics for batches of 50 videos concurrently, yielding each batch's parsed statistics as it arrives"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tasks = [
+        asyncio.create_task(_fetch_videos_async(video_ids[i:i + 50], session, semaphore))
+        for i in range(0, len(video_ids), 50)
+    ]
+    try:
+        for task in asyncio.as_completed(tasks):
+            videos = await task
+            yield [_extract_video_statistics(video) for video in videos]
+    finally:
+        # a failed batch or a consumer that stops early shouldn't leave the other requests running
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 async def fetch_video_comments(
     video_id: str,
     session: aiohttp.ClientSession,
     semaphore: asyncio.Semaphore,
 ) -> list:
+    async with contextlib.aclosing(
+        fetch_video_comment_threads(video_id, session, semaphore)
+    ) as pages:
+        async for comments in pages:
+            yield [comment["text"] for comment in comments]
+
+
+async def fetch_video_comment_threads(
+    video_id: str,
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.Semaphore,
+    fresh: bool = False,
+) -> list:
+    """Yields pages of top level comments, newest first, as dicts with the comment's id, text and publish time.
+    If fresh, the pages are always requested again instead of being read from the http cache"""
     comments_endpoint = "https://www.googleapis.com/youtube/v3/commentThreads"
     query_params = {
         "key": API_KEY,
         "videoId": video_id,
         "part": "snippet,replies",
+        "order": "time",
         "maxResults": 100
     }
     try:
-        async with semaphore:
-            async with session.get(
-                comments_endpoint, params=query_params, timeout=15
-            ) as res:
-                comment_data = await res.json()
+        while True:
+            # the semaphore is only held per request, so other videos get a turn between pages
+            async with semaphore:
+                comment_data = await http_cache.get_json_async(
+                    session, comments_endpoint, query_params, fresh=fresh
+                )
+            try:
                 comments = [
-                    comment["snippet"]["topLevelComment"]["snippet"]["textOriginal"]
+                    {
+                        "id": comment["snippet"]["topLevelComment"]["id"],
+                        "text": comment["snippet"]["topLevelComment"]["snippet"]["textOriginal"],
+                        "published_at": comment["snippet"]["topLevelComment"]["snippet"]["publishedAt"],
+                    }
                     for comment in comment_data["items"]
                 ]
-                yield comments
-                while comment_data.get("nextPageToken"):
-                    query_params["pageToken"] = comment_data["nextPageToken"]
-                    async with session.get(
-                        comments_endpoint, params=query_params, timeout=15
-                    ) as res:
-                        comment_data = await res.json()
-                        try:
-                            comments = [
-                                    comment["snippet"]["topLevelComment"]["snippet"][
-                                        "textOriginal"
-                                    ]
-                                    for comment in comment_data["items"]
-                                ]
-                        except KeyError:
-                            print(f"could not parse comment data: {comment_data}")
-                            return
-                        yield comments
+            except KeyError:
+                print(f"could not parse comment data: {comment_data}")
+                return
+            yield comments
+            if not comment_data.get("nextPageToken"):
+                return
+            query_params["pageToken"] = comment_data["nextPageToken"]
     except TimeoutError:
         print(f"Timeout Error for video ID: {video_id}")
 
@@ -78,19 +112,29 @@ def fetch_all_channel_videos(username: str) -> list:
     data = _fetch_channel_videos(playlist_id)
     return _extract_video_info(data)
 
+def fetch_new_channel_videos(username: str, known_ids: set) -> list:
+    """Fetches only the channel's videos uploaded since the newest one in known_ids"""
+    playlist_id = _fetch_uploads_playlist_id(username)
+    data = _fetch_channel_videos(playlist_id, known_ids)
+    return _extract_video_info(data)
+
 def _fetch_uploads_playlist_id(username: str) -> str:
-    url = f"https://www.googleapis.com/youtube/v3/channels?part=contentDetails&forUsername={username}&key={API_KEY}"
+    url = "https://www.googleapis.com/youtube/v3/channels"
+    query_params = {
+        "key": API_KEY,
+        "part": "contentDetails",
+        "forUsername": username,
+    }
 
     # call the api with a timeout of 15 seconds
     logging.info("requesting uploads playlist id for channel \"%s\"", username)
-    response = requests.get(url, timeout=15)
-    # convert the json response to a python dictionary
-    data = response.json()
+    data = http_cache.get_json(url, params=query_params, timeout=15)
     assert isinstance(data, dict)
     logging.info("uploads playlist id for channel is \"%s\"", data["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"])
     return data["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
 
-def _fetch_channel_videos(playlist_id):
+def _fetch_channel_videos(playlist_id, known_ids: set = None):
+    """Pages through the uploads playlist newest first. If known_ids is given, stops at the first video already in it"""
     url = f"https://www.googleapis.com/youtube/v3/playlistItems"
 
     query_params = {
@@ -102,28 +146,35 @@ def _fetch_channel_videos(playlist_id):
 
     # call the api with a timeout of 15 seconds
     logging.info("requested channel videos for playlist id \"%s\"", playlist_id)
-    response = requests.get(url, params=query_params, timeout=15)
-
-    # convert the json response to a python dictionary
-    data_res = response.json()
-    data = data_res["items"]
-    assert isinstance(data, list)
+    data_res = http_cache.get_json(url, params=query_params, timeout=15)
+    data = []
+    assert isinstance(data_res["items"], list)
 
     with tqdm(total=None, desc='fetching channel videos', unit=' videos', ncols=100) as pbar:
-        last_len = len(data)
-        pbar.update(last_len)
-        while data_res.get("nextPageToken"):
+        while True:
+            new_items = _take_until_known(data_res["items"], known_ids)
+            data.extend(new_items)
+            pbar.update(len(new_items))
+            if len(new_items) < len(data_res["items"]):
+                logging.info("reached already known video, stopping after %s new videos", len(data))
+                break
+            if not data_res.get("nextPageToken"):
+                break
             query_params["pageToken"] = data_res["nextPageToken"]
-            response = requests.get(url, params=query_params, timeout=15)
+            data_res = http_cache.get_json(url, params=query_params, timeout=15)
             logging.info("requested next page of channel videos")
-            data_res = response.json()
-            data.extend(data_res["items"])
-            pbar.update(len(data) - last_len)
-            last_len = len(data)
 
     # print(json.dumps(data, indent=4))
     return data
 
+def _take_until_known(items: list, known_ids: set) -> list:
+    if not known_ids:
+        return items
+    for i, item in enumerate(items):
+        if item["snippet"]["resourceId"]["videoId"] in known_ids:
+            return items[:i]
+    return items
+
 def _fetch_videos(video_ids: list) -> dict:
     videos_endpoint = f"https://www.googleapis.com/youtube/v3/videos"
     assert len(video_ids) <= 50, "Max number of videos per request is 50"
@@ -135,7 +186,7 @@ def _fetch_videos(video_ids: list) -> dict:
     }
 
     # call the api with a timeout of 15 seconds
-    response = requests.get(videos_endpoint, params=query_params, timeout=15).json()
+    response = http_cache.get_json(videos_endpoint, params=query_params, timeout=15)
     try:
         video_stats = response["items"]
         logging.info("requested video statistics for %s video IDs", len(video_ids))
@@ -146,10 +197,31 @@ def _fetch_videos(video_ids: list) -> dict:
     while response.get("nextPageToken"):
         logging.info("requesting next page of video statistics")
         query_params["pageId"] = response["nextPageToken"]
-        response = requests.get(videos_endpoint, params=query_params, timeout=15)
-        response = response.json()
-        video_stats.extend(response.json()["items"])
+        response = http_cache.get_json(videos_endpoint, params=query_params, timeout=15)
+        video_stats.extend(response["items"])
+
+    return video_stats
 
+async def _fetch_videos_async(
+    video_ids: list,
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.Semaphore,
+) -> list:
+    videos_endpoint = "https://www.googleapis.com/youtube/v3/videos"
+    assert len(video_ids) <= 50, "Max number of videos per request is 50"
+    query_params = {
+        "key": API_KEY,
+        "id": ",".join(video_ids),
+        "part": "statistics,snippet,contentDetails",
+    }
+    async with semaphore:
+        response = await http_cache.get_json_async(session, videos_endpoint, query_params)
+    try:
+        video_stats = response["items"]
+        logging.info("requested video statistics for %s video IDs", len(video_ids))
+    except KeyError as exc:
+        logging.error("no videos found for given ids. Response received: %s", response)
+        raise KeyError("No videos found for given ids") from exc
     return video_stats
 
 def _extract_video_statistics(data: dict) -> dict:
@@ -179,6 +251,7 @@ def _extract_video_info(videos):
         {
             "id": video["snippet"]["resourceId"]["videoId"],
             "title": video["snippet"]["title"],
+            "upload_date": video["snippet"]["publishedAt"],
         }
         for video in videos
     ]
@@ -14,16 +14,26 @@ class Scene(BaseModel):
     title: Optional[str] = None
     scene_type: str
     cast: List[str]
+    episode_id: Optional[str] = None
+    air_date: Optional[str] = None
+    host: Optional[str] = None
 
 class Sketch(BaseModel):
     id: str
     title: str
     scene_type: str
     cast: List[str]
+    episode_id: Optional[str] = None
+    air_date: Optional[str] = None
+    host: Optional[str] = None
     upload_date: Optional[str] = None
     duration: Optional[int] = None
     view_count: Optional[int] = None
     like_count: Optional[int] = None
     comment_count: Optional[int] = None
     mean_sentiment: Optional[float] = None
-    std_sentiment: Optional[float] = None
\ No newline at end of file
+    std_sentiment: Optional[float] = None
+    # comments are fetched newest first, so when --max-comments or --target-sentiment-se stops a video early,
+    # the sentiment and its confidence interval only describe its newest comments, not a random sample of them
+    sentiment_comment_count: Optional[int] = None
+    sentiment_ci_width: Optional[float] = None
\ No newline at end of file
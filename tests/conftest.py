@@ -0,0 +1,4 @@
+import os
+
+# data_collection.youtube refuses to import without a key. The tests never call the api, so any value will do
+os.environ.setdefault("YOUTUBE_API_KEY", "test")
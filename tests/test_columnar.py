@@ -0,0 +1,36 @@
+from analysis import columnar
+from analysis.columnar import SCENE_COLUMN_KINDS, encode_columns, get_rows, iter_rows
+
+SCENES = [
+    {"title": f"Scene {i % 7}" if i % 5 else None, "scene_type": "Sketch", "cast": ["A", "B"][: i % 3],
+     "episode_id": None, "air_date": "1990-01-01" if i % 2 else None, "host": None}
+    for i in range(50)
+]
+
+
+def _get_columns() -> dict:
+    return encode_columns(SCENES, SCENE_COLUMN_KINDS, lambda scene, field: scene.get(field))
+
+
+def test_rows_round_trip():
+    columns = _get_columns()
+    assert get_rows(columns, SCENE_COLUMN_KINDS) == SCENES
+    assert list(iter_rows(columns, SCENE_COLUMN_KINDS, chunk_size=8)) == SCENES
+    assert list(iter_rows(columns, SCENE_COLUMN_KINDS, rows=[3, 0, 49], fields=["title"], chunk_size=2)) == [
+        {"title": SCENES[i]["title"]} for i in (3, 0, 49)
+    ]
+
+
+def test_iter_rows_decodes_lazily(monkeypatch):
+    columns = _get_columns()
+    decoded_rows = []
+    decode_column = columnar.decode_column
+
+    def counting_decode_column(columns, field, kind, rows=None):
+        decoded_rows.extend(rows.tolist())
+        return decode_column(columns, field, kind, rows)
+
+    monkeypatch.setattr(columnar, "decode_column", counting_decode_column)
+    rows = iter_rows(columns, SCENE_COLUMN_KINDS, fields=["title"], chunk_size=10)
+    assert next(rows) == {"title": SCENES[0]["title"]}
+    assert decoded_rows == list(range(10))
@@ -0,0 +1,36 @@
+import numpy as np
+from analysis.comment_dedup import CommentDeduplicator, get_band_keys
+
+LOVED = "Honestly one of the best sketches they have done in years, the whole cast was great and I loved every second of it"
+HATED = "Honestly one of the worst sketches they have done in years, the whole cast was great and I hated every second of it"
+
+
+def _assign(dedup: CommentDeduplicator, texts: list) -> tuple:
+    return dedup.assign(texts, get_band_keys(texts))
+
+
+def test_only_exact_duplicates_share_a_score():
+    dedup = CommentDeduplicator(max_copies=1)
+    text_ids, counted = _assign(dedup, [LOVED, HATED, "  " + LOVED.upper()])
+    # the near duplicate with the opposite sentiment is a copy for spam counting but gets its own score
+    assert text_ids[0] != text_ids[1]
+    assert text_ids[0] == text_ids[2]
+    assert counted.tolist() == [True, False, False]
+    dedup.set_scores(dedup.get_unscored(text_ids), np.array([0.9, -0.3]))
+    assert dedup.get_scores(text_ids).tolist() == [0.9, -0.3, 0.9]
+    assert dedup.num_duplicates == 1
+    assert dedup.num_near_duplicates == 2
+
+
+def test_short_texts_are_near_duplicates():
+    dedup = CommentDeduplicator(max_copies=1)
+    text_ids, counted = _assign(dedup, ["😂😂😂", "😂😂😂😂", "haha", "hahaha", "lol"])
+    assert len(set(text_ids.tolist())) == 5
+    assert counted.tolist() == [True, False, True, False, True]
+
+
+def test_copies_are_counted_across_pages():
+    dedup = CommentDeduplicator(max_copies=2)
+    _assign(dedup, ["first!", "great sketch"])
+    _, counted = _assign(dedup, ["FIRST!!!", "first!", "great sketch"])
+    assert counted.tolist() == [True, False, True]
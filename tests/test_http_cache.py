@@ -0,0 +1,117 @@
+import asyncio
+import gzip
+import json
+import os
+import pytest
+from data_collection import http_cache, youtube
+from data_collection.http_cache import OfflineCacheMiss, ResponseCache
+
+URL = "https://www.googleapis.com/youtube/v3/videos"
+
+
+def _truncate_entries(directory: str):
+    for entry in os.scandir(directory):
+        with open(entry.path, "rb") as f:
+            data = f.read()
+        with open(entry.path, "wb") as f:
+            f.write(data[: len(data) // 2])
+
+
+def test_round_trip(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.set(URL, {"id": "abc", "key": "secret"}, b'{"items": []}')
+    assert cache.get(URL, {"id": "abc"}) == b'{"items": []}'
+    # nothing but the entry is left in the directory
+    assert [name for name in os.listdir(tmp_path) if not name.endswith(".gz")] == []
+
+
+def test_truncated_entry_is_a_miss(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.set(URL, {"id": "abc"}, b"x" * 10000)
+    _truncate_entries(str(tmp_path))
+    assert cache.get(URL, {"id": "abc"}) is None
+    assert os.listdir(tmp_path) == []
+    cache.set(URL, {"id": "abc"}, b"fresh")
+    assert cache.get(URL, {"id": "abc"}) == b"fresh"
+
+
+def test_truncated_entry_offline(tmp_path):
+    ResponseCache(str(tmp_path)).set(URL, {"id": "abc"}, b"x" * 10000)
+    _truncate_entries(str(tmp_path))
+    with pytest.raises(OfflineCacheMiss):
+        ResponseCache(str(tmp_path), offline=True).get(URL, {"id": "abc"})
+
+
+def test_failed_write_leaves_no_entry(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path))
+
+    def fail(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(gzip.GzipFile, "write", fail)
+    with pytest.raises(KeyboardInterrupt):
+        cache.set(URL, {"id": "abc"}, b"body")
+    monkeypatch.undo()
+    assert os.listdir(tmp_path) == []
+    assert cache.get(URL, {"id": "abc"}) is None
+
+
+class _FakeResponse:
+    def __init__(self, body: bytes):
+        self.status = 200
+        self._body = body
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class _FakeCommentSession:
+    """Serves a single page of comment threads, newest first"""
+
+    def __init__(self):
+        self.comments = []
+        self.num_requests = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.num_requests += 1
+        items = [
+            {"snippet": {"topLevelComment": {"id": comment_id, "snippet": {"textOriginal": text, "publishedAt": "2024"}}}}
+            for comment_id, text in reversed(self.comments)
+        ]
+        return _FakeResponse(json.dumps({"items": items}).encode("utf-8"))
+
+
+def _fetch_comment_ids(session, fresh: bool) -> list:
+    async def fetch():
+        pages = youtube.fetch_video_comment_threads("abc", session, asyncio.Semaphore(1), fresh=fresh)
+        return [comment["id"] for page in [page async for page in pages] for comment in page]
+
+    return asyncio.run(fetch())
+
+
+def test_refresh_sees_new_comments(tmp_path, monkeypatch):
+    monkeypatch.setattr(http_cache, "_cache", None)
+    http_cache.enable_cache(directory=str(tmp_path))
+    session = _FakeCommentSession()
+    session.comments.append(("1", "first"))
+    assert _fetch_comment_ids(session, fresh=False) == ["1"]
+    session.comments.append(("2", "second"))
+    # a plain fetch is served from the cache, a refresh goes back to the api and stores what it gets
+    assert _fetch_comment_ids(session, fresh=False) == ["1"]
+    assert _fetch_comment_ids(session, fresh=True) == ["2", "1"]
+    assert _fetch_comment_ids(session, fresh=False) == ["2", "1"]
+    assert session.num_requests == 2
+
+
+def test_episode_list_expires_before_episode_pages(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    list_ttl = cache._get_ttl(http_cache._normalize_url("http://www.snlarchives.net/Episodes/"))
+    episode_ttl = cache._get_ttl(http_cache._normalize_url("http://www.snlarchives.net/Episodes/?197510111"))
+    assert list_ttl == http_cache.HOUR
+    assert episode_ttl > list_ttl
@@ -0,0 +1,32 @@
+import json
+import numpy as np
+import pytest
+import collection
+from data_collection.scene_index import pick_most_recent_scene
+
+COLUMNS = {"title": np.array([0, 1], dtype=np.int32), "title.categories": np.array(["A", "B"])}
+
+
+@pytest.mark.parametrize(
+    "setting, value",
+    [
+        ("MATCHER_VERSION", collection.MATCHER_VERSION + 1),
+        ("MATCH_THRESHOLD", 0.9),
+        ("MATCH_MAX_CANDIDATES", 10),
+        ("MATCH_WINDOW_DAYS", 30),
+        ("MATCH_TIE_BREAK", pick_most_recent_scene),
+    ],
+)
+def test_matcher_changes_discard_cached_matches(tmp_path, monkeypatch, setting, value):
+    monkeypatch.setattr(collection, "MATCH_CACHE_PATH", str(tmp_path / "match_cache.json"))
+    collection._save_match_cache(collection._get_match_fingerprint(COLUMNS), {"a": None})
+    assert collection._load_match_cache(collection._get_match_fingerprint(COLUMNS)) == {"a": None}
+    monkeypatch.setattr(collection, setting, value)
+    assert collection._load_match_cache(collection._get_match_fingerprint(COLUMNS)) == {}
+
+
+def test_archive_only_caches_are_discarded(tmp_path, monkeypatch):
+    path = tmp_path / "match_cache.json"
+    monkeypatch.setattr(collection, "MATCH_CACHE_PATH", str(path))
+    path.write_text(json.dumps({"archive_fingerprint": "old", "matches": {"a": None}}))
+    assert collection._load_match_cache(collection._get_match_fingerprint(COLUMNS)) == {}
@@ -0,0 +1,29 @@
+from analysis.columnar import SCENE_COLUMN_KINDS, encode_columns
+from data_collection.scene_index import ENCORE_SCENE_TYPE, SceneIndex, pick_most_recent_scene
+
+SCENES = [
+    {"title": "Prose And Cons", "scene_type": "Film", "cast": ["Eddie Murphy"], "air_date": None},
+    {"title": "Prose And Cons", "scene_type": ENCORE_SCENE_TYPE, "cast": [], "air_date": None},
+    {"title": "Kannon AE-1", "scene_type": "Commercial", "cast": ["Phil Hartman"], "air_date": None},
+    {"title": "Kannon AE-1", "scene_type": "Commercial", "cast": ["Phil Hartman"], "air_date": None},
+    {"title": "Kannon AE-1", "scene_type": ENCORE_SCENE_TYPE, "cast": [], "air_date": None},
+    {"title": "Only Aired Again", "scene_type": ENCORE_SCENE_TYPE, "cast": [], "air_date": None},
+]
+VIDEO = {"title": "some video", "upload_date": "2015-01-01T00:00:00Z"}
+
+
+def _get_indexes(**kwargs) -> list:
+    columns = encode_columns(SCENES, SCENE_COLUMN_KINDS, lambda scene, field: scene.get(field))
+    return [SceneIndex(SCENES, **kwargs), SceneIndex.from_columns(columns, **kwargs)]
+
+
+def test_duplicate_titles_resolve_to_the_original():
+    for kwargs in ({}, {"tie_break": pick_most_recent_scene}):
+        for index in _get_indexes(**kwargs):
+            assert index.get_scene("Prose And Cons", VIDEO)["scene_type"] == "Film"
+            assert index.get_scene("Kannon AE-1", VIDEO)["scene_type"] == "Commercial"
+
+
+def test_encore_is_used_without_an_original():
+    for index in _get_indexes():
+        assert index.get_scene("Only Aired Again", VIDEO)["scene_type"] == ENCORE_SCENE_TYPE
@@ -0,0 +1,58 @@
+import random
+import pytest
+from vaderSentiment.vaderSentiment import BOOSTER_DICT, NEGATE, SENTIMENT_LADEN_IDIOMS, SPECIAL_CASES
+from analysis import sentiment
+from analysis.sentiment import get_parity_mismatches
+
+# the rules' edge cases: "but" (including vaderSentiment's list.index quirk), negation windows,
+# "least", "kind of", caps emphasis, punctuation amplifiers, idioms and emoji
+EDGE_CASES = [
+    "That was awesome...love her throwing things 😂❤😊😅",
+    "Heidi's character is very weak. It's a Jost written character and it relies on just throwing things. "
+    "Unimaginative slapstick is just cheap comedy for morons",
+    "Seems like lately Weekend Update has been running a little short. What's up with that",
+    "", "😂", "a😂b",
+    "The sketch was GOOD but the ending was bad", "Not bad at all!!", "at least it was funny", "least funny cast",
+    "kind of funny", "no good", "no no good", "no or nor good", "never so good", "without doubt good",
+    "That sketch was the shit", "yeah right, funny", "sort of funny??", "VERY funny stuff", "very FUNNY stuff",
+    "he isn't funny", "kiss of death for the show", "good but good but bad, sad but great",
+]
+NUM_RANDOM_COMMENTS = 5000
+
+
+@pytest.fixture(scope="module", autouse=True)
+def analyzers():
+    sentiment.init_sentiment_worker()
+
+
+def _get_random_comments(seed: int = 0) -> list:
+    rng = random.Random(seed)
+    lexicon = sorted(sentiment.analyzer.lexicon)
+    special = [word for phrase in list(SPECIAL_CASES) + list(SENTIMENT_LADEN_IDIOMS) for word in phrase.split()]
+    pools = [
+        lexicon,
+        sorted(BOOSTER_DICT),
+        sorted(NEGATE),
+        ["but", "BUT", "least", "at", "kind", "of", "never", "so", "this", "without", "doubt", "no"],
+        special,
+        ["the", "sketch", "was", "show", "cast", "host", "he", "she", "it"],
+        ["😂", "❤", "😊", "😅", "💀"],
+    ]
+    comments = []
+    for _ in range(NUM_RANDOM_COMMENTS):
+        words = []
+        for _ in range(rng.randint(1, 25)):
+            word = rng.choice(rng.choice(pools))
+            if rng.random() < 0.15:
+                word = word.upper()
+            words.append(word + rng.choice(["", "", "", "!", "!!", "?", "??", ".", ",", "..."]))
+        comments.append(" ".join(words))
+    return comments
+
+
+def test_edge_cases_match_vader():
+    assert get_parity_mismatches(EDGE_CASES) == []
+
+
+def test_random_comments_match_vader():
+    assert get_parity_mismatches(_get_random_comments()) == []
@@ -0,0 +1,29 @@
+import asyncio
+import contextlib
+import pytest
+from data_collection import youtube
+
+
+def test_failed_batch_cancels_the_others(monkeypatch):
+    cancelled = []
+
+    async def fetch_videos(batch, session, semaphore):
+        if batch[0] == 0:
+            raise TimeoutError
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(batch[0])
+            raise
+        return []
+
+    async def fetch_all():
+        with pytest.raises(TimeoutError):
+            async with contextlib.aclosing(youtube.fetch_video_statistics_async(list(range(150)), None)) as batches:
+                async for _ in batches:
+                    pass
+        # checked before asyncio.run cancels whatever is left on its own
+        return sorted(cancelled)
+
+    monkeypatch.setattr(youtube, "_fetch_videos_async", fetch_videos)
+    assert asyncio.run(fetch_all()) == [50, 100]